@@ -1,23 +1,28 @@
 import cv2
-from pyzbar import pyzbar
+from tiled_decode import zbar_decode
+from frame_sources import open_source
+from stage_metrics import draw_overlay, metrics, report as report_metrics, start_exporter
 
 def main():
-    # Open default camera (0)
-    cap = cv2.VideoCapture(0)
+    # Open default camera (0), or FRAME_SOURCE if set
+    cap = open_source(default=0)
     if not cap.isOpened():
         print("Error: Could not open webcam.")
         return
 
     print("Press 'q' to exit.")
+    exporter = start_exporter()
 
     while True:
-        ret, frame = cap.read()
+        with metrics.stage('capture'):
+            ret, frame = cap.read()
         if not ret:
             print("Failed to grab frame.")
             break
 
         # Decode barcodes and QR codes in the frame
-        barcodes = pyzbar.decode(frame)
+        with metrics.stage('decode'):
+            barcodes = zbar_decode(frame)
         for barcode in barcodes:
             x, y, w, h = barcode.rect
             # Draw rectangle around code
@@ -30,16 +35,22 @@ def main():
             cv2.putText(frame, label, (x, y - 10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
 
+        draw_overlay(frame, fps_stage='decode', stages=('capture', 'decode', 'imshow'))
         # Show the frame
-        cv2.imshow("Barcode/QR Code Scanner", frame)
+        with metrics.stage('imshow'):
+            cv2.imshow("Barcode/QR Code Scanner", frame)
+            key = cv2.waitKey(1) & 0xFF
 
         # Exit loop on 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if key == ord('q'):
             break
 
     # Cleanup
     cap.release()
     cv2.destroyAllWindows()
+    if exporter:
+        exporter.stop()
+    report_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,12 @@
 import cv2
-from pyzbar import pyzbar
+from tiled_decode import zbar_decode
+from frame_sources import open_source
+from stage_metrics import draw_overlay, metrics, report as report_metrics, start_exporter
+from headless import HEADLESS, emit, install_signal_handlers, open_result_sink, stop_event
 from datetime import datetime
+import time
+
+REPEAT_INTERVAL = 2.0       # Seconds before a code that stays in view is sent to the sinks again
 
 def log_barcode(data: str, code_type: str):
     """Log detected barcode/QR code to the terminal with a timestamp."""
@@ -8,29 +14,54 @@ def log_barcode(data: str, code_type: str):
     print(f"[{timestamp}] Detected {code_type}: {data}")
 
 def main():
-    # Open default camera (0)
-    cap = cv2.VideoCapture(0)
+    install_signal_handlers()
+    sink = open_result_sink()
+    # Open default camera (0), or FRAME_SOURCE if set
+    cap = open_source(default=0)
     if not cap.isOpened():
         print("Error: Could not open webcam.")
         return
 
-    print("Press 'q' to exit.")
+    print("Press 'q' to exit." if not HEADLESS else "Running headless. Stop with Ctrl+C / SIGTERM.")
+    exporter = start_exporter()
+    last_sent = {}      # text -> time it last went to the sink
+    frame_no = 0
 
-    while True:
-        ret, frame = cap.read()
+    while not stop_event.is_set():
+        with metrics.stage('capture'):
+            ret, frame = cap.read()
         if not ret:
             print("Failed to grab frame.")
             break
+        frame_no += 1
 
         # Decode barcodes and QR codes in the frame
-        barcodes = pyzbar.decode(frame)
+        with metrics.stage('decode'):
+            barcodes = zbar_decode(frame)
+        records = []
+        now = time.monotonic()
         for barcode in barcodes:
             x, y, w, h = barcode.rect
-            # Draw rectangle around code
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
             data = barcode.data.decode('utf-8')
             typ = barcode.type
+
+            # Codes that stay in view go to the sink again every REPEAT_INTERVAL
+            fresh = now - last_sent.get(data, -REPEAT_INTERVAL) >= REPEAT_INTERVAL
+            if fresh:
+                last_sent[data] = now
+                records.append({
+                    'text': data,
+                    'format': typ,
+                    'confidence': getattr(barcode, 'quality', None),
+                    'localization': [(p.x, p.y) for p in barcode.polygon],
+                })
+            if HEADLESS:
+                if fresh:
+                    log_barcode(data, typ)
+                continue
+
+            # Draw rectangle around code
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
             label = f"{data} ({typ})"
             # Put decoded text above rectangle
             cv2.putText(frame, label, (x, y - 10),
@@ -38,17 +69,29 @@ def main():
 
             # Log to terminal
             log_barcode(data, typ)
+        emit(sink, f"camera#{frame_no}", records)
+        if HEADLESS:
+            continue
 
+        draw_overlay(frame, fps_stage='decode', stages=('capture', 'decode', 'imshow'))
         # Show the frame
-        cv2.imshow("Barcode/QR Code Scanner", frame)
+        with metrics.stage('imshow'):
+            cv2.imshow("Barcode/QR Code Scanner", frame)
+            key = cv2.waitKey(1) & 0xFF
 
         # Exit loop on 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if key == ord('q'):
             break
 
     # Cleanup
     cap.release()
-    cv2.destroyAllWindows()
+    if sink:
+        sink.close()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
+    if exporter:
+        exporter.stop()
+    report_metrics()
 
 if __name__ == "__main__":
     main()
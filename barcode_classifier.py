@@ -5,61 +5,79 @@
 # DataMatrix, QR, and barcodes in real time.
 
 # --- Required Libraries ---
-# Install via: pip install opencv-python numpy pillow pylibdmtx pyzbar imutils torch torchvision
+# Install via: pip install opencv-python numpy pylibdmtx pyzbar (optional: onnxruntime)
 
 import cv2
 import numpy as np
-from PIL import Image
-from pylibdmtx.pylibdmtx import decode as dmtx_decode
-from pyzbar.pyzbar import decode as zbar_decode
 import threading
 import queue
 import time
-import imutils
+from concurrent.futures import ThreadPoolExecutor, wait
+from decoder_cascade import DecoderCascade
+from roi_tracker import RoiTracker
+from crop_cache import CropCache
+from region_proposals import DETECT_SCALE, downscale, map_boxes, propose_regions
+from onnx_sr import get_resolver
+from frame_sources import open_source
+from stage_metrics import draw_overlay, metrics, report as report_metrics, start_exporter
+from headless import HEADLESS, box_record, emit, install_signal_handlers, open_result_sink, stop_event
 
 # --- Configuration ---
 CAMERA_INDEX = 1            # Change to match your camera device
 FRAME_WIDTH = 1920          # Desired capture resolution
 FRAME_HEIGHT = 1080
 MIN_CONTOUR_AREA = 100      # Minimum area to consider a candidate region
+MIN_FILL_RATIO = 0.0        # Minimum share of its bounding box a candidate quad must cover (rotated squares: 0.5)
 STACK_SIZE = 5              # Number of frames to stack for noise reduction
+STACK_MODE = 'window'       # 'window' (sliding mean of STACK_SIZE frames) or 'ema'
+EMA_ALPHA = 0.2             # Weight of the newest frame in 'ema' mode
+MOTION_THRESHOLD = None     # Mean abs pixel change that restarts the average (None = off)
 SR_SCALE = 2                # Upscaling factor for super-resolution fallback
-USE_CV2_SR = True           # If True, use OpenCV cubic resize
+USE_CV2_SR = False          # If True, skip the ONNX SR model and always use OpenCV cubic resize
+SR_MIN_SIZE = 48            # ROIs with a shorter side go straight to super-resolution
+DECODER_ORDER = ('zbar', 'dmtx')  # Cheapest backend first; stops at the first hit
+DECODE_WORKERS = 4          # ROI decode threads (pyzbar/pylibdmtx/cv2 release the GIL)
+FRAME_DEADLINE = 0.05       # Seconds to wait for ROI decodes before showing the frame
+MAX_PENDING_ROIS = 64       # Cap on unfinished ROI decodes carried between frames
 
-# --- Optional Model-Based Super-Resolution Setup (comment out if unused) ---
-# Uncomment below to enable a pretrained Real-ESRGAN via torch.hub
-# import torch
-# sr_model = torch.hub.load('xinntao/Real-ESRGAN', 'RealESRGAN_x2plus', pretrained=True)
-# sr_model.eval()
-# device = 'cuda' if torch.cuda.is_available() else 'cpu'
-# sr_model.to(device)
+# --- Optional Model-Based Super-Resolution ---
+# Drop an ONNX x2/x4 model at models/sr_x2.onnx (or set SR_MODEL_PATH) to enable it;
+# see onnx_sr.py. Without onnxruntime or a model, cubic resize is used.
 
 
 def super_resolve(crop: np.ndarray) -> np.ndarray:
+    """Upscales a single crop (ONNX model if available, else cubic by SR_SCALE)."""
+    return super_resolve_batch([crop])[0]
+
+
+def super_resolve_batch(crops: list) -> list:
     """
-    Upscales the crop by SR_SCALE.
-    By default, uses OpenCV cubic interpolation as a fallback.
-    If a model is loaded, you can replace this section with model inference.
+    Upscales all crops of a frame with one batched ONNX inference call.
+    Falls back to OpenCV cubic interpolation by SR_SCALE when there is no
+    model or it fails at inference (the resolver then stays disabled).
     """
-    h, w = crop.shape[:2]
-    # Fallback: OpenCV resize
-    return cv2.resize(crop, (w * SR_SCALE, h * SR_SCALE), interpolation=cv2.INTER_CUBIC)
+    if not USE_CV2_SR:
+        upscaled = get_resolver().upscale_batch(crops)
+        if upscaled is not None:
+            return upscaled
+    return [cv2.resize(c, (c.shape[1] * SR_SCALE, c.shape[0] * SR_SCALE),
+                       interpolation=cv2.INTER_CUBIC) for c in crops]
 
 
-def detect_code_regions(gray: np.ndarray) -> list:
-    """Return bounding boxes of candidate code regions"""
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+def detect_code_regions(gray: np.ndarray, scale: float = DETECT_SCALE) -> list:
+    """
+    Return full-resolution bounding boxes of candidate code regions, best first.
+    With scale < 1 the search runs on a downscaled frame and boxes are mapped back.
+    """
+    full_shape = gray.shape
+    gray = downscale(gray, scale)
+    min_area = MIN_CONTOUR_AREA * min(1.0, scale) ** 2
+    blur = cv2.GaussianBlur(gray, (5, 5), 0) if scale >= 1.0 else cv2.GaussianBlur(gray, (3, 3), 0)
     _, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    cnts = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    cnts = imutils.grab_contours(cnts)
-    boxes = []
-    for c in cnts:
-        peri = cv2.arcLength(c, True)
-        approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-        if len(approx) == 4 and cv2.contourArea(approx) > MIN_CONTOUR_AREA:
-            x, y, w, h = cv2.boundingRect(approx)
-            boxes.append((x, y, w, h))
-    return boxes
+    # Ranked best-first, so decode_rois submits the most promising ROIs first
+    boxes, _ = propose_regions(th, min_area=min_area, max_area_frac=1.0, min_fill=MIN_FILL_RATIO)
+    boxes = [tuple(int(v) for v in b) for b in boxes]
+    return map_boxes(boxes, scale, full_shape)
 
 
 def stack_and_process(frames: list) -> np.ndarray:
@@ -69,71 +87,252 @@ def stack_and_process(frames: list) -> np.ndarray:
     return stack
 
 
+class FrameStacker:
+    """
+    Running-average frame stacker: one denoised frame out for every frame in.
+    'window' keeps a ring buffer of the last `size` frames and a float32 sum
+    (add the newest, subtract the oldest); 'ema' keeps an exponential average.
+    With `motion_threshold` set, a large change between consecutive frames
+    restarts the average so moving boards don't smear.
+    All buffers are allocated once and reused; the returned frame is
+    overwritten by the next push().
+    """
+
+    def __init__(self, size=STACK_SIZE, mode=STACK_MODE, alpha=EMA_ALPHA,
+                 motion_threshold=MOTION_THRESHOLD):
+        if mode not in ('window', 'ema'):
+            raise ValueError(f"Unknown stack mode: {mode}")
+        self.size = size
+        self.mode = mode
+        self.alpha = alpha
+        self.motion_threshold = motion_threshold
+        self.shape = None
+
+    def _allocate(self, frame):
+        self.shape = frame.shape
+        self.acc = np.zeros(frame.shape, np.float32)
+        self.out = np.zeros(frame.shape, np.uint8)
+        slots = self.size if self.mode == 'window' else 1
+        self.ring = np.zeros((slots,) + frame.shape, np.uint8)
+        self.count = 0
+        self.index = 0
+
+    def reset(self, frame):
+        """Restart the average from `frame`."""
+        self.acc[...] = frame
+        self.ring[0] = frame
+        self.count = 1
+        self.index = 1 % len(self.ring)
+
+    def _moved(self, frame):
+        last = self.ring[(self.index - 1) % len(self.ring)]
+        return cv2.norm(frame, last, cv2.NORM_L1) / frame.size > self.motion_threshold
+
+    def push(self, frame: np.ndarray) -> np.ndarray:
+        if frame.shape != self.shape:
+            self._allocate(frame)
+        if self.count == 0 or (self.motion_threshold is not None and self._moved(frame)):
+            self.reset(frame)
+        elif self.mode == 'ema':
+            cv2.accumulateWeighted(frame, self.acc, self.alpha)
+            self.ring[0] = frame
+        else:
+            slot = self.ring[self.index]
+            if self.count == self.size:
+                np.subtract(self.acc, slot, out=self.acc)   # drop the oldest frame
+            else:
+                self.count += 1
+            np.copyto(slot, frame)
+            cv2.accumulate(frame, self.acc)
+            self.index = (self.index + 1) % self.size
+
+        scale = 1.0 if self.mode == 'ema' else 1.0 / self.count
+        cv2.convertScaleAbs(self.acc, dst=self.out, alpha=scale)
+        return self.out
+
+
+decoder = DecoderCascade(DECODER_ORDER)
+crop_cache = CropCache()
+
+
 def decode_codes(crop: np.ndarray) -> list:
-    """Decode DataMatrix & QR/barcodes from the crop"""
-    pil = Image.fromarray(crop)
+    """Decode QR/barcodes & DataMatrix from a BGR crop, stopping at the first backend that hits"""
+    with metrics.stage('decode_codes'):
+        return decoder.decode_texts(crop)
+
+def decode_rois(stack: np.ndarray, rois: list, pending: dict) -> tuple:
+    """
+    Decodes the ROIs of one frame on the ROI pool within FRAME_DEADLINE.
+    `rois` is a list of (key, box); keys already being decoded are skipped.
+
+    Each crop is first decoded as-is. Crops that fail, and crops shorter than
+    SR_MIN_SIZE, are super-resolved together in one batch and decoded again.
+    Repeated crops are answered from the crop cache. Decodes still running at
+    the deadline stay in `pending` (future -> (key, box, crop, cache_key, sr))
+    and are collected on a later frame instead of blocking this one.
+    Returns ([(key, box, texts), ...], pending).
+    """
+    deadline = time.perf_counter() + FRAME_DEADLINE
     results = []
-    # DataMatrix
-    for r in dmtx_decode(pil):
-        results.append(r.data.decode('utf-8'))
-    # QR & 1D barcodes
-    for z in zbar_decode(pil):
-        results.append(z.data.decode('utf-8'))
-    return list(set(results))
+    needs_sr = []
+    in_flight = {entry[0] for entry in pending.values()}
+    for key, box in rois:
+        if len(pending) >= MAX_PENDING_ROIS:
+            break
+        if key in in_flight:
+            continue
+        x, y, w, h = box
+        crop = stack[y:y+h, x:x+w].copy()  # the stack buffer may be reused next frame
+        cache_key = crop_cache.key_func(crop)
+        texts = crop_cache.get(cache_key, crop)
+        if texts is not None:
+            results.append((key, box, texts))
+        elif min(w, h) < SR_MIN_SIZE:
+            needs_sr.append((key, box, crop, cache_key))
+        else:
+            pending[roi_pool.submit(decode_codes, crop)] = (key, box, crop, cache_key, False)
+
+    def collect(timeout):
+        done, _ = wait(pending, timeout=max(0.0, timeout))
+        for fut in done:
+            key, box, crop, cache_key, sr = pending.pop(fut)
+            try:
+                texts = fut.result()
+            except Exception as e:
+                print("ROI decode failed:", e)
+                continue
+            if texts or sr:
+                crop_cache.put(cache_key, texts, crop)
+                results.append((key, box, texts))
+            else:
+                needs_sr.append((key, box, crop, cache_key))
+
+    def submit_sr():
+        if not needs_sr:
+            return
+        with metrics.stage('super_resolve'):
+            sr_crops = super_resolve_batch([item[2] for item in needs_sr])
+        for (key, box, crop, cache_key), sr_crop in zip(needs_sr, sr_crops):
+            pending[roi_pool.submit(decode_codes, sr_crop)] = (key, box, crop, cache_key, True)
+        needs_sr.clear()
+
+    collect(deadline - time.perf_counter())
+    submit_sr()
+    collect(deadline - time.perf_counter())
+    # Plain decodes that failed during the second wait are queued with SR for a later frame
+    submit_sr()
+    return results, pending
 
 # --- Threaded Pipeline Components ---
 frame_queue = queue.Queue(maxsize=STACK_SIZE)
-running = True
+roi_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+END_OF_STREAM = None        # Queued by camera_thread when a replayed source runs out
+
+
+def _put_until_stopped(item):
+    while not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
 
 
 def camera_thread():
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
-    while running:
-        ret, frame = cap.read()
+    cap = open_source(default=CAMERA_INDEX, width=FRAME_WIDTH, height=FRAME_HEIGHT)
+    while not stop_event.is_set():
+        with metrics.stage('capture'):
+            ret, frame = cap.read()
         if not ret:
+            _put_until_stopped(END_OF_STREAM)
             break
+        if not cap.live:
+            _put_until_stopped(frame)   # replayed source: lossless, wait for the consumer
+            continue
         if frame_queue.full():
-            frame_queue.get()
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                pass
         frame_queue.put(frame)
     cap.release()
 
 
-def processing_thread():
-    cv2.namedWindow('PCB Scanner', cv2.WINDOW_NORMAL)
-    while running:
-        if frame_queue.qsize() < STACK_SIZE:
-            time.sleep(0.01)
+def processing_thread(sink=None):
+    """Stack, detect, track and decode; draws a preview window unless HEADLESS."""
+    if not HEADLESS:
+        cv2.namedWindow('PCB Scanner', cv2.WINDOW_NORMAL)
+    pending = {}
+    stacker = FrameStacker()
+    tracker = RoiTracker()
+    tracks_by_id = {}
+    frame_no = 0
+    while not stop_event.is_set():
+        try:
+            frame = frame_queue.get(timeout=0.1)
+        except queue.Empty:
             continue
-        frames = [frame_queue.get() for _ in range(STACK_SIZE)]
-        stack = stack_and_process(frames)
-        gray = cv2.cvtColor(stack, cv2.COLOR_BGR2GRAY)
-        boxes = detect_code_regions(gray)
-        display = stack.copy()
-        for x, y, w, h in boxes:
-            crop = stack[y:y+h, x:x+w]
-            sr_crop = super_resolve(crop)
-            texts = decode_codes(cv2.cvtColor(sr_crop, cv2.COLOR_BGR2RGB))
-            if texts:
-                cv2.rectangle(display, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(display, texts[0], (x, y-5), cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5, (0, 255, 0), 1)
-        cv2.imshow('PCB Scanner', display)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if frame is END_OF_STREAM:
+            break
+        frame_no += 1
+        with metrics.stage('frame'):
+            with metrics.stage('stack'):
+                stack = stacker.push(frame)
+            with metrics.stage('cvtColor'):
+                gray = cv2.cvtColor(stack, cv2.COLOR_BGR2GRAY)
+            # Detect only periodically or on motion; otherwise keep the tracked boxes
+            if tracker.should_detect(gray):
+                with metrics.stage('detect'):
+                    boxes = detect_code_regions(gray)
+                tracks_by_id = {t.id: t for t in tracker.update(boxes)}
+            # Tracks with a confident result are not decoded again
+            rois = [(t.id, t.box) for t in tracker.to_decode()]
+            with metrics.stage('decode'):
+                results, pending = decode_rois(stack, rois, pending)
+            new_codes = []
+            for track_id, box, texts in results:
+                track = tracks_by_id.get(track_id)
+                if track is not None and track.report(texts):
+                    new_codes.append(box_record(track.text, box))
+            emit(sink, f"pcb_scanner#{frame_no}", new_codes)
+            if HEADLESS:
+                continue
+            with metrics.stage('draw'):
+                display = stack.copy()
+                for track in tracker.decoded():
+                    x, y, w, h = track.box
+                    cv2.rectangle(display, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                    cv2.putText(display, track.text, (x, y-5), cv2.FONT_HERSHEY_SIMPLEX,
+                                0.5, (0, 255, 0), 1)
+                draw_overlay(display, stages=('stack', 'detect', 'decode', 'super_resolve', 'draw', 'imshow'))
+            with metrics.stage('imshow'):
+                cv2.imshow('PCB Scanner', display)
+                key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
             break
-    cv2.destroyAllWindows()
+    stop_event.set()
+    if not HEADLESS:
+        cv2.destroyAllWindows()
+    roi_pool.shutdown(wait=False, cancel_futures=True)
 
 # --- Main Execution ---
 if __name__ == '__main__':
+    install_signal_handlers()
+    sink = open_result_sink()
+    exporter = start_exporter()
     cam_t = threading.Thread(target=camera_thread, daemon=True)
-    proc_t = threading.Thread(target=processing_thread, daemon=True)
+    proc_t = threading.Thread(target=processing_thread, args=(sink,), daemon=True)
     cam_t.start()
     proc_t.start()
-    try:
-        while True:
-            time.sleep(0.1)
-    except KeyboardInterrupt:
-        running = False
-        cam_t.join()
-        proc_t.join()
+    # Wait in short joins so signal handlers run promptly on the main thread
+    while proc_t.is_alive():
+        proc_t.join(0.1)
+    stop_event.set()
+    cam_t.join(timeout=2.0)
+    if sink:
+        sink.close()
+    print("Decoder stats:", decoder.report())
+    print("Crop cache:", crop_cache.stats())
+    if exporter:
+        exporter.stop()
+    report_metrics()
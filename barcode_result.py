@@ -0,0 +1,448 @@
+# Shared barcode result types
+# ---------------------------
+# BarcodeResult is one decoded code: immutable, __slots__ only, and readable
+# like the record dicts used so far (r['text'], r['format'], r['confidence'],
+# r['localization'], plus r['box'] as matrix_decoder used it), so sinks and
+# drawing code take either.
+#
+# ResultBatch holds many results column-wise for batch workloads: one NumPy
+# structured array (image id, text id, format id, confidence, 4-point quad;
+# 46 bytes a row) plus interned string tables for image names, texts and
+# formats. It serialises to
+#
+#   JSON         always (orjson when installed)
+#   msgpack      pip install msgpack   (raw rows + string tables)
+#   Arrow IPC    pip install pyarrow   (dictionary-encoded strings, zero-copy columns)
+#
+# merge() / ResultBatch.merged() collapse repeated reads of one code: same text
+# and box IoU >= iou_threshold keep the most confident (then largest) read.
+
+import json
+
+import numpy as np
+
+RESULT_DTYPE = np.dtype([
+    ('image', '<u4'),
+    ('text', '<u4'),
+    ('format', '<u2'),
+    ('confidence', '<f4'),      # NaN = unknown
+    ('quad', '<f4', (4, 2)),
+])
+MERGE_IOU = 0.5
+FORMAT_VERSION = 1
+
+
+def quad_from_points(points):
+    """Four corner points: the points themselves, or their bounding box for other counts."""
+    pts = [tuple(p) for p in points]
+    if len(pts) == 4:
+        return pts
+    if not pts:
+        return [(0, 0)] * 4
+    xs = [p[0] for p in pts]
+    ys = [p[1] for p in pts]
+    x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+    return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+
+
+def bounding_box(points):
+    """(x1, y1, x2, y2) of a sequence of (x, y) points."""
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def iou(a, b):
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+# --- Single result ---
+class BarcodeResult:
+    """One decoded code. Immutable; also readable as a record dict (see module comment)."""
+
+    __slots__ = ('text', 'format', 'confidence', 'localization')
+    _KEYS = ('text', 'format', 'confidence', 'localization')
+
+    def __init__(self, text, format=None, confidence=None, localization=()):
+        set_ = object.__setattr__
+        set_(self, 'text', text)
+        set_(self, 'format', format)
+        set_(self, 'confidence', confidence)
+        set_(self, 'localization', tuple(tuple(p) for p in localization))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BarcodeResult is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("BarcodeResult is immutable")
+
+    @classmethod
+    def from_record(cls, record):
+        """From an image_barcode record dict (or another BarcodeResult)."""
+        if isinstance(record, cls):
+            return record
+        return cls(record['text'], record.get('format'), record.get('confidence'),
+                   record.get('localization') or ())
+
+    @classmethod
+    def from_box(cls, text, box, format=None, confidence=None):
+        """From an (x1, y1, x2, y2) box, e.g. matrix_decoder's CLI results."""
+        x1, y1, x2, y2 = box
+        return cls(text, format, confidence, [(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+
+    @property
+    def box(self):
+        return bounding_box(self.localization) if self.localization else (0, 0, 0, 0)
+
+    # Mapping-style access, so code written against the record dicts keeps working
+    def keys(self):
+        return self._KEYS
+
+    def __getitem__(self, key):
+        if key == 'box':
+            return self.box
+        if key in self._KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_record(self):
+        return {'text': self.text, 'format': self.format, 'confidence': self.confidence,
+                'localization': [list(p) for p in self.localization]}
+
+    def __eq__(self, other):
+        if not isinstance(other, BarcodeResult):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self._KEYS)
+
+    def __hash__(self):
+        return hash((self.text, self.format, self.confidence, self.localization))
+
+    def __repr__(self):
+        return (f"BarcodeResult(text={self.text!r}, format={self.format!r}, "
+                f"confidence={self.confidence!r}, localization={self.localization!r})")
+
+    def __reduce__(self):
+        return (BarcodeResult, (self.text, self.format, self.confidence, self.localization))
+
+
+def _rank(result):
+    # Most confident first, then largest box (unknown confidence counts as lowest)
+    conf = result['confidence']
+    x1, y1, x2, y2 = bounding_box(quad_from_points(result['localization']))
+    return (-(conf if conf is not None else float('-inf')), -(x2 - x1) * (y2 - y1))
+
+
+def merge(results, iou_threshold=MERGE_IOU):
+    """
+    Collapses repeated reads of one code (equal text, box IoU >= iou_threshold)
+    into the most confident, then largest, read. Works on record dicts and
+    BarcodeResults alike; texts keep their first-seen order.
+    """
+    groups = {}
+    for r in results:
+        groups.setdefault(r['text'], []).append(r)
+    merged = []
+    for group in groups.values():
+        kept, kept_boxes = [], []
+        for r in sorted(group, key=_rank):
+            box = bounding_box(quad_from_points(r['localization']))
+            if all(iou(box, other) < iou_threshold for other in kept_boxes):
+                kept.append(r)
+                kept_boxes.append(box)
+        merged.extend(kept)
+    return merged
+
+
+# --- Columnar batch ---
+class _Interned:
+    """Append-only string table: value <-> small integer id."""
+
+    __slots__ = ('values', '_ids')
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self._ids = {v: i for i, v in enumerate(self.values)}
+
+    def id(self, value):
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+    def remap(self, other):
+        """Array mapping `other`'s ids to ids in this table (adding missing values)."""
+        return np.array([self.id(v) for v in other.values], np.uint32)
+
+
+class ResultBatch:
+    """Results of many images in one structured array (see RESULT_DTYPE)."""
+
+    def __init__(self, capacity=1024):
+        self._rows = np.zeros(max(1, capacity), RESULT_DTYPE)
+        self._n = 0
+        self.images = _Interned()
+        self.texts = _Interned()
+        self.formats = _Interned()
+
+    @property
+    def rows(self):
+        """The filled part of the structured array (a view)."""
+        return self._rows[:self._n]
+
+    def __len__(self):
+        return self._n
+
+    def _reserve(self, extra):
+        need = self._n + extra
+        if need > len(self._rows):
+            grown = np.zeros(max(need, 2 * len(self._rows)), RESULT_DTYPE)
+            grown[:self._n] = self._rows[:self._n]
+            self._rows = grown
+
+    def extend(self, results, image=None):
+        """Appends record dicts / BarcodeResults of one image."""
+        results = list(results)
+        if not results:
+            return self
+        self._reserve(len(results))
+        rows = self._rows[self._n:self._n + len(results)]
+        rows['image'] = self.images.id(image)
+        rows['text'] = [self.texts.id(r['text']) for r in results]
+        rows['format'] = [self.formats.id(r['format']) for r in results]
+        rows['confidence'] = [np.nan if r['confidence'] is None else float(r['confidence']) for r in results]
+        rows['quad'] = [quad_from_points(r['localization']) for r in results]
+        self._n += len(results)
+        return self
+
+    def append(self, result, image=None):
+        return self.extend([result], image)
+
+    def extend_batch(self, other):
+        """Appends another batch (e.g. from a worker process), re-mapping its string ids."""
+        if not len(other):
+            return self
+        rows = other.rows
+        self._reserve(len(rows))
+        dst = self._rows[self._n:self._n + len(rows)]
+        dst[:] = rows
+        for field, table in (('image', 'images'), ('text', 'texts'), ('format', 'formats')):
+            dst[field] = getattr(self, table).remap(getattr(other, table))[rows[field]]
+        self._n += len(rows)
+        return self
+
+    @classmethod
+    def from_records(cls, records, image=None):
+        return cls(len(records) or 1).extend(records, image)
+
+    def _result(self, row):
+        quad = row['quad']
+        if np.all(quad == np.round(quad)):
+            quad = quad.astype(np.int64)
+        conf = float(row['confidence'])
+        return BarcodeResult(self.texts.values[row['text']], self.formats.values[row['format']],
+                             None if np.isnan(conf) else conf, quad.tolist())
+
+    def __getitem__(self, idx):
+        if not -self._n <= idx < self._n:
+            raise IndexError(idx)
+        return self._result(self._rows[idx % self._n])
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self._result(row)
+
+    def image_of(self, idx):
+        return self.images.values[self.rows[idx]['image']]
+
+    def by_image(self):
+        """{image: [BarcodeResult, ...]} in insertion order."""
+        out = {}
+        for row in self.rows:
+            out.setdefault(self.images.values[row['image']], []).append(self._result(row))
+        return out
+
+    def take(self, indices):
+        """New batch with the given rows (string tables are copied as they are)."""
+        batch = ResultBatch(len(indices) or 1)
+        batch._rows[:len(indices)] = self.rows[indices]
+        batch._n = len(indices)
+        batch.images, batch.texts, batch.formats = (_Interned(t.values) for t in
+                                                    (self.images, self.texts, self.formats))
+        return batch
+
+    def boxes(self):
+        """(n, 4) float32 array of x1, y1, x2, y2."""
+        quad = self.rows['quad']
+        return np.concatenate([quad.min(axis=1), quad.max(axis=1)], axis=1)
+
+    def merged(self, iou_threshold=MERGE_IOU):
+        """merge() per image over the whole batch; returns a new batch in the original order."""
+        rows = self.rows
+        n = len(rows)
+        if not n:
+            return self.take(np.arange(0))
+        boxes = self.boxes()
+        area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        conf = np.nan_to_num(rows['confidence'], nan=-np.inf)
+        order = np.lexsort((-area, -conf, rows['text'], rows['image']))
+        key = (rows['image'][order].astype(np.uint64) << 32) | rows['text'][order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+
+        keep = np.zeros(n, bool)
+        keep[order[starts[sizes == 1]]] = True      # most (image, text) pairs are read once
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            kept = []
+            for idx in order[start:start + size]:
+                if all(iou(boxes[idx], boxes[k]) < iou_threshold for k in kept):
+                    kept.append(idx)
+            keep[kept] = True
+        return self.take(np.flatnonzero(keep))
+
+    # --- Serialisation ---
+    def _columns(self):
+        rows = self.rows
+        return {
+            'version': FORMAT_VERSION,
+            'images': self.images.values,
+            'texts': self.texts.values,
+            'formats': self.formats.values,
+            'image': np.ascontiguousarray(rows['image']),
+            'text': np.ascontiguousarray(rows['text']),
+            'format': np.ascontiguousarray(rows['format']),
+            'confidence': np.ascontiguousarray(rows['confidence']),
+            'quad': np.ascontiguousarray(rows['quad']).reshape(-1),
+        }
+
+    @classmethod
+    def _from_columns(cls, cols):
+        n = len(cols['image'])
+        batch = cls(n or 1)
+        rows = batch._rows[:n]
+        for field in ('image', 'text', 'format', 'confidence'):
+            rows[field] = cols[field]
+        rows['quad'] = np.asarray(cols['quad'], np.float32).reshape(n, 4, 2)
+        batch._n = n
+        batch.images, batch.texts, batch.formats = (_Interned(cols[k]) for k in ('images', 'texts', 'formats'))
+        return batch
+
+    def to_json(self):
+        """Columnar JSON (UTF-8 bytes); unknown confidences are null."""
+        cols = self._columns()
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        if orjson is not None:
+            return orjson.dumps(cols, option=orjson.OPT_SERIALIZE_NUMPY)
+        out = {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in cols.items()}
+        out['confidence'] = [None if c != c else c for c in out['confidence']]
+        return json.dumps(out, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def from_json(cls, data):
+        try:
+            import orjson
+            cols = orjson.loads(data)
+        except ImportError:
+            cols = json.loads(data)
+        cols['confidence'] = np.array([np.nan if c is None else c for c in cols['confidence']], np.float32)
+        return cls._from_columns(cols)
+
+    def to_msgpack(self):
+        """Raw little-endian rows plus the string tables."""
+        import msgpack
+        return msgpack.packb({
+            'version': FORMAT_VERSION,
+            'images': self.images.values,
+            'texts': self.texts.values,
+            'formats': self.formats.values,
+            'rows': self.rows.tobytes(),
+        }, use_bin_type=True)
+
+    @classmethod
+    def from_msgpack(cls, data):
+        import msgpack
+        doc = msgpack.unpackb(data, raw=False)
+        rows = np.frombuffer(doc['rows'], RESULT_DTYPE)
+        batch = cls(len(rows) or 1)
+        batch._rows[:len(rows)] = rows
+        batch._n = len(rows)
+        batch.images, batch.texts, batch.formats = (_Interned(doc[k]) for k in ('images', 'texts', 'formats'))
+        return batch
+
+    def to_arrow(self):
+        """pyarrow.Table: dictionary-encoded image/text/format, confidence, quad as 8 floats."""
+        import pyarrow as pa
+        cols = self._columns()
+
+        def dictionary(ids, values):
+            return pa.DictionaryArray.from_arrays(pa.array(ids.astype(np.int32)), pa.array(values, pa.string()))
+
+        return pa.table({
+            'image': dictionary(cols['image'], cols['images']),
+            'text': dictionary(cols['text'], cols['texts']),
+            'format': dictionary(cols['format'], cols['formats']),
+            'confidence': pa.array(cols['confidence'], mask=np.isnan(cols['confidence'])),
+            'quad': pa.FixedSizeListArray.from_arrays(pa.array(cols['quad']), 8),
+        })
+
+    @classmethod
+    def from_arrow(cls, table):
+        table = table.unify_dictionaries().combine_chunks()
+        cols = {}
+        for field, table_key in (('image', 'images'), ('text', 'texts'), ('format', 'formats')):
+            arr = table.column(field).chunk(0) if table.num_rows else None
+            cols[field] = arr.indices.to_numpy(zero_copy_only=False) if arr is not None else []
+            cols[table_key] = arr.dictionary.to_pylist() if arr is not None else []
+        if table.num_rows:
+            cols['confidence'] = table.column('confidence').to_numpy(zero_copy_only=False).astype(np.float32)
+            cols['quad'] = table.column('quad').chunk(0).flatten().to_numpy(zero_copy_only=False)
+        else:
+            cols['confidence'], cols['quad'] = [], []
+        return cls._from_columns(cols)
+
+    def write_arrow(self, path):
+        """Arrow IPC file (readable with pyarrow.ipc.open_file, Polars, DuckDB...)."""
+        import pyarrow as pa
+        table = self.to_arrow()
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    @classmethod
+    def read_arrow(cls, path):
+        import pyarrow as pa
+        with pa.memory_map(path, 'r') as source:
+            return cls.from_arrow(pa.ipc.open_file(source).read_all())
+
+    def save(self, path):
+        """Writes the batch in the format given by the extension: .arrow / .msgpack / .json."""
+        from result_sinks import atomic_write
+        if path.endswith(('.arrow', '.feather', '.ipc')):
+            self.write_arrow(path)
+        elif path.endswith(('.msgpack', '.mpk')):
+            atomic_write(path, self.to_msgpack())
+        else:
+            atomic_write(path, self.to_json())
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(('.arrow', '.feather', '.ipc')):
+            return cls.read_arrow(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        return cls.from_msgpack(data) if path.endswith(('.msgpack', '.mpk')) else cls.from_json(data)
@@ -0,0 +1,160 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+
+import cv2
+
+from board_segment import FAST_SEGMENT
+from preprocess_pipeline import PRESETS, build_pipeline, collect_images, output_path
+from rembg_session import REMBG_MODEL, REMBG_THREADS, get_session
+from result_sinks import atomic_write
+
+# Batch background removal / preprocessing
+# ----------------------------------------
+# Runs the preprocess_pipeline presets (the image_preprocess / grayscale flows)
+# over whole directories on several processes. Every worker loads the rembg
+# model at most once (rembg_session.get_session), only when board_segment's
+# fast path is not confident, and keeps one pipeline per mode; file
+# reads and writes happen on I/O threads in the parent while the workers run
+# inference, with a bounded number of images in flight.
+#
+#   python batch_preprocess.py sample_images --mode invert --workers 2 --threads 4
+#
+# Modes (output names match the single-image scripts):
+#   bg       <name>_bg_removed.png      background removed (BGRA)
+#   process  <name>_bw_inverted.jpg     image_preprocess: desaturate + invert
+#   invert   <name>_inverted.jpg        grayscale: threshold + invert
+
+IO_THREADS = 4
+INFLIGHT_PER_WORKER = 2     # Images queued per worker so inference never waits on disk
+
+
+#---------------------------------------WORKER PROCESS-----------------------------------------------------#
+_pipelines = {}
+_session = None
+
+
+def _init_worker(model, threads):
+    global _session
+    # One rembg model per worker: loaded right away without fast segmentation,
+    # otherwise on the first image that needs the fallback
+    _session = partial(get_session, model, threads)
+    if not FAST_SEGMENT:
+        _session()
+
+
+def _process(mode, data):
+    """Worker: encoded input bytes -> encoded output bytes (or None), pipeline ms and per-stage info."""
+    pipeline = _pipelines.get(mode)
+    if pipeline is None:
+        pipeline = _pipelines[mode] = build_pipeline(mode, session=_session)
+    start = time.perf_counter()
+    try:
+        out = pipeline.run(data)
+    except ValueError as e:
+        print("ERROR: Failed to process image:", e)
+        return None, (time.perf_counter() - start) * 1000.0, {}
+    ok, buf = cv2.imencode(os.path.splitext(PRESETS[mode][1])[1], out)
+    return (buf.tobytes() if ok else None), (time.perf_counter() - start) * 1000.0, pipeline.last_info
+
+
+#---------------------------------------BATCH DRIVER-------------------------------------------------------#
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def run_batch(paths, mode, out_dir=None, workers=1, threads=REMBG_THREADS, model=REMBG_MODEL):
+    os.makedirs(out_dir or PRESETS[mode][2], exist_ok=True)
+    stats = {'images': len(paths), 'ok': 0, 'failed': 0, 'fast_segment': 0, 'rembg': 0, 'pipeline_ms': 0.0}
+    max_inflight = max(1, workers * INFLIGHT_PER_WORKER)
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(IO_THREADS) as io, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model, threads)) as pool:
+        in_flight = {}
+        writes = []
+        reads = deque()
+        queued = iter(paths)
+
+        def prefetch():
+            # Read ahead only as far as the workers can take, not the whole folder
+            while len(reads) < max_inflight:
+                path = next(queued, None)
+                if path is None:
+                    return
+                reads.append((path, io.submit(_read, path)))
+
+        def finish(done):
+            for fut in done:
+                path = in_flight.pop(fut)
+                try:
+                    data, pipeline_ms, info = fut.result()
+                except Exception as e:
+                    data, pipeline_ms, info = None, 0.0, {}
+                    print(f"ERROR: {path}: {e}")
+                stats['pipeline_ms'] += pipeline_ms
+                segment = info.get('segment')
+                if segment:
+                    stats['fast_segment' if segment['path'] == 'fast' else 'rembg'] += 1
+                    print(f"{path}: {segment['path']} (confidence {segment.get('confidence', 0.0)}, "
+                          f"{segment['ms']} ms)")
+                if data is None:
+                    stats['failed'] += 1
+                    print(f"ERROR: Failed to process image: {path}")
+                    continue
+                stats['ok'] += 1
+                writes.append(io.submit(atomic_write, output_path(path, mode, out_dir), data))
+
+        prefetch()
+        while reads:
+            path, read = reads.popleft()
+            prefetch()
+            try:
+                data = read.result()
+            except OSError as e:
+                print(f"ERROR: File not found: {path} ({e})")
+                stats['failed'] += 1
+                continue
+            while len(in_flight) >= max_inflight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                finish(done)
+            in_flight[pool.submit(_process, mode, data)] = path
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            finish(done)
+        for w in writes:
+            w.result()
+
+    elapsed = time.perf_counter() - start
+    stats['elapsed_s'] = round(elapsed, 2)
+    stats['images_per_s'] = round(len(paths) / elapsed, 2) if elapsed > 0 else 0.0
+    stats['mean_pipeline_ms'] = round(stats.pop('pipeline_ms') / max(1, stats['ok'] + stats['failed']), 1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Background removal and preprocessing for whole folders.')
+    parser.add_argument('sources', nargs='+', help='Image files or directories')
+    parser.add_argument('--mode', choices=sorted(PRESETS), default='process')
+    parser.add_argument('--out', help='Output directory (default depends on --mode)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, one rembg session each')
+    parser.add_argument('--threads', type=int, default=REMBG_THREADS or max(1, (os.cpu_count() or 2) // 2),
+                        help='onnxruntime intra-op threads per worker')
+    parser.add_argument('--model', default=REMBG_MODEL)
+    args = parser.parse_args()
+
+    paths = collect_images(args.sources)
+    if not paths:
+        print("No images found.")
+        sys.exit(1)
+    stats = run_batch(paths, args.mode, args.out, args.workers, args.threads, args.model)
+    print("Batch done:", stats)
+
+
+if __name__ == '__main__':
+    main()
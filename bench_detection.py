@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import barcode_classifier
+import matrix_decoder_orig
+from roi_tracker import iou_matrix
+
+# Detection benchmark: runs both candidate detectors at full resolution (the
+# reference) and at each pyramid scale, and reports per-scale latency and recall
+# of the full-resolution boxes. The original per-contour loops (LEGACY) are timed
+# as well, and every scale also reports recall of their boxes and its speedup
+# over them.
+#
+#   python bench_detection.py sample_images --scales 1 0.5 0.25 --out detect_bench.json
+
+DETECTORS = {
+    'detect_code_regions': barcode_classifier.detect_code_regions,
+    'detect_candidates': matrix_decoder_orig.detect_candidates,
+}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+MATCH_IOU = 0.5
+
+
+# --- Legacy reference (the loops propose_regions replaced) ---
+def legacy_code_regions(gray):
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for c in contours:
+        approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+        if len(approx) == 4 and cv2.contourArea(approx) > 100:
+            boxes.append(cv2.boundingRect(approx))
+    return boxes
+
+
+def legacy_candidates(gray):
+    blur = cv2.bilateralFilter(gray, 10, 75, 75)
+    thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    h, w = gray.shape[:2]
+    boxes = []
+    for c in contours:
+        area = cv2.contourArea(c)
+        if area < 100 or area > w * h * 0.2:
+            continue
+        approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            x, y, cw, ch = cv2.boundingRect(approx)
+            if 0.8 < cw / ch < 1.2:
+                boxes.append((x, y, cw, ch))
+    return boxes
+
+
+LEGACY = {
+    'detect_code_regions': legacy_code_regions,
+    'detect_candidates': legacy_candidates,
+}
+
+
+def load_gray_images(paths):
+    images = []
+    for path in paths:
+        names = sorted(os.listdir(path)) if os.path.isdir(path) else [path]
+        for name in names:
+            full = os.path.join(path, name) if os.path.isdir(path) else name
+            if not full.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            gray = cv2.imread(full, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                print("Skipping unreadable image:", full, file=sys.stderr)
+                continue
+            images.append((full, gray))
+    return images
+
+
+def recall(reference, boxes, threshold=MATCH_IOU):
+    """Fraction of reference boxes overlapped by at least one candidate box."""
+    if not reference:
+        return None
+    if not boxes:
+        return 0.0
+    ious = iou_matrix(np.array(reference), np.array(boxes))
+    return float((ious.max(axis=1) >= threshold).mean())
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, result
+
+
+def run(images, scales, repeat):
+    report = {}
+    for det_name, detect in DETECTORS.items():
+        legacy = {'ms': [], 'boxes': 0}
+        per_scale = {s: {'ms': [], 'recall': [], 'recall_legacy': [], 'boxes': 0} for s in scales}
+        for _, gray in images:
+            _, reference = time_call(lambda: detect(gray, 1.0), 1)
+            ms, legacy_boxes = time_call(lambda: LEGACY[det_name](gray), repeat)
+            legacy['ms'].append(ms)
+            legacy['boxes'] += len(legacy_boxes)
+            for s in scales:
+                ms, boxes = time_call(lambda: detect(gray, s), repeat)
+                per_scale[s]['ms'].append(ms)
+                per_scale[s]['boxes'] += len(boxes)
+                for key, ref in (('recall', reference), ('recall_legacy', legacy_boxes)):
+                    r = recall(ref, boxes)
+                    if r is not None:
+                        per_scale[s][key].append(r)
+        legacy_ms = float(np.mean(legacy['ms']))
+        report[det_name] = {
+            'legacy': {'mean_ms': round(legacy_ms, 3), 'boxes': legacy['boxes']},
+        }
+        for s, v in per_scale.items():
+            mean_ms = float(np.mean(v['ms']))
+            report[det_name][str(s)] = {
+                'mean_ms': round(mean_ms, 3),
+                'speedup_vs_legacy': round(legacy_ms / mean_ms, 2) if mean_ms else None,
+                'recall_vs_full_res': round(float(np.mean(v['recall'])), 4) if v['recall'] else None,
+                'recall_vs_legacy': round(float(np.mean(v['recall_legacy'])), 4) if v['recall_legacy'] else None,
+                'boxes': v['boxes'],
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pyramid candidate detection against full resolution and the legacy loops.')
+    parser.add_argument('paths', nargs='*', default=['sample_images'], help='Image files or directories')
+    parser.add_argument('--scales', nargs='+', type=float, default=[1.0, 0.5, 0.25])
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions per image (best is kept)')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    images = load_gray_images(args.paths)
+    if not images:
+        print("No images found.", file=sys.stderr)
+        sys.exit(1)
+
+    report = {'images': len(images), 'detectors': run(images, args.scales, args.repeat)}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,472 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from frame_sources import pcb_board
+from stage_metrics import StageMetrics
+
+# Synthetic barcode benchmark
+# ---------------------------
+# Generates labelled PCB-like test images (DataMatrix, QR, Code39, Code128) with
+# controlled degradations and runs every decode pipeline we ship on the same
+# corpus. The JSON report (decode rate, images/s, per-stage latency percentiles)
+# is meant to be diffed run to run.
+#
+#   python benchmark_suite.py --count 50 --out bench.json
+#   python benchmark_suite.py --count 20 --blur-sigma 0 3 --save corpus/      # keep the images
+#   python benchmark_suite.py --corpus corpus/ --pipelines classifier   # re-run a saved corpus
+#
+# Each degradation is drawn uniformly from its [min, max] range per image; pass
+# the same value twice (e.g. --rotation-deg 15 15) to hold it fixed.
+
+SYMBOLOGIES = ('datamatrix', 'qr', 'code39', 'code128')
+PIPELINES = ('pyzbar', 'classifier', 'matrix_orig', 'image_barcode')
+DEFAULT_RANGES = {
+    'module_px':    (2, 6),      # Pixels per module (narrow bar for 1D codes)
+    'rotation_deg': (-30, 30),
+    'perspective':  (0.0, 0.08), # Corner jitter as a fraction of the label size
+    'blur_sigma':   (0.0, 1.5),  # Gaussian blur sigma in pixels
+    'noise_std':    (0.0, 10.0), # Gaussian sensor noise, gray levels
+    'glare':        (0.0, 0.5),  # Peak brightness of a specular spot, fraction of 255
+}
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+TEXT_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'   # Valid in every symbology
+TEXT_LENGTH = (6, 12)
+BACKEND_MODULES = {
+    'zbar': 'pyzbar.pyzbar',
+    'dmtx': 'pylibdmtx.pylibdmtx',
+    'dynamsoft': 'dynamsoft_barcode_reader_bundle',
+}
+STUB_DECODER_ORDER = ('zbar', 'dmtx')   # What the stubbed Dynamsoft router decodes with
+STAGE_WINDOW_S = 1e6        # Stage histogram window: long enough that a run never rotates out samples
+
+
+# --- Symbol encoders ---
+# Every encoder returns a uint8 gray image at one pixel per module, quiet zone included.
+
+# Code39 patterns (zxing order): 9 elements bar/space alternating, bit set = wide
+CODE39_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-. $/+%*'
+CODE39_PATTERNS = (
+    0x034, 0x121, 0x061, 0x160, 0x031, 0x130, 0x070, 0x025, 0x124, 0x064,
+    0x109, 0x049, 0x148, 0x019, 0x118, 0x058, 0x00D, 0x10C, 0x04C, 0x01C,
+    0x103, 0x043, 0x142, 0x013, 0x112, 0x052, 0x007, 0x106, 0x046, 0x016,
+    0x181, 0x0C1, 0x1C0, 0x091, 0x190, 0x0D0, 0x085, 0x184, 0x0C4, 0x0A8,
+    0x0A2, 0x08A, 0x02A, 0x094,
+)
+CODE39_WIDE = 3
+
+# Code128 element widths (bar, space, bar, space, bar, space[, bar]), values 0-106
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312',
+    '132212', '221213', '221312', '231212', '112232', '122132', '122231', '113222',
+    '123122', '123221', '223211', '221132', '221231', '213212', '223112', '312131',
+    '311222', '321122', '321221', '312212', '322112', '322211', '212123', '212321',
+    '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121',
+    '313121', '211331', '231131', '213113', '213311', '213131', '311123', '311321',
+    '331121', '312113', '312311', '332111', '314111', '221411', '431111', '111224',
+    '111422', '121124', '121421', '141122', '141221', '112214', '112412', '122114',
+    '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112',
+    '421211', '212141', '214121', '412121', '111143', '111341', '131141', '114113',
+    '114311', '411113', '411311', '113141', '114131', '311141', '411131', '211412',
+    '211214', '211232', '2331112',
+)
+CODE128_START_B = 104
+CODE128_STOP = 106
+
+
+def _bars_to_image(widths, quiet=10):
+    """Alternating bar/space module widths -> 1D symbol image (bars are black)."""
+    row = [255] * quiet
+    for i, w in enumerate(widths):
+        row += [0 if i % 2 == 0 else 255] * w
+    row += [255] * quiet
+    height = max(24, len(row) // 5)
+    return np.tile(np.array(row, np.uint8), (height, 1))
+
+
+def encode_code39(text):
+    widths = []
+    for ch in '*' + text + '*':
+        bits = CODE39_PATTERNS[CODE39_CHARS.index(ch)]
+        widths += [CODE39_WIDE if bits & (1 << (8 - i)) else 1 for i in range(9)]
+        widths.append(1)             # inter-character gap
+    return _bars_to_image(widths[:-1])
+
+
+def encode_code128(text):
+    values = [CODE128_START_B] + [ord(ch) - 32 for ch in text]
+    checksum = (values[0] + sum(i * v for i, v in enumerate(values[1:], 1))) % 103
+    widths = []
+    for v in values + [checksum, CODE128_STOP]:
+        widths += [int(c) for c in CODE128_PATTERNS[v]]
+    return _bars_to_image(widths)
+
+
+def encode_qr(text):
+    qr = cv2.QRCodeEncoder.create().encode(text)      # 1 px/module with a 1-module border
+    return cv2.copyMakeBorder(qr, 2, 2, 2, 2, cv2.BORDER_CONSTANT, value=255)
+
+
+def encode_datamatrix(text):
+    from pylibdmtx.pylibdmtx import encode
+    encoded = encode(text.encode('utf-8'))
+    img = np.frombuffer(encoded.pixels, np.uint8).reshape(encoded.height, encoded.width, encoded.bpp // 8)
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    # libdmtx draws 5 px modules with a 2-module margin
+    return cv2.resize(gray, (encoded.width // 5, encoded.height // 5), interpolation=cv2.INTER_NEAREST)
+
+
+ENCODERS = {
+    'datamatrix': encode_datamatrix,
+    'qr': encode_qr,
+    'code39': encode_code39,
+    'code128': encode_code128,
+}
+
+
+# --- Corpus ---
+def draw_params(rng, ranges):
+    params = {}
+    for name, (lo, hi) in ranges.items():
+        if name == 'module_px':
+            params[name] = int(rng.integers(int(lo), int(hi) + 1))
+        else:
+            params[name] = round(float(rng.uniform(lo, hi)), 3)
+    return params
+
+
+def render_sample(rng, symbol, params, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """
+    Composites one symbol onto a PCB background and applies the degradations.
+    Returns (BGR image, quad) where quad is the symbol's corners in the image.
+    """
+    m = params['module_px']
+    label = cv2.resize(symbol, None, fx=m, fy=m, interpolation=cv2.INTER_NEAREST)
+    lh, lw = label.shape
+    # Grow the frame if the rotated label would not fit
+    diag = int(np.hypot(lw, lh) * (1 + 2 * params['perspective'])) + 20
+    width, height = max(width, diag), max(height, diag)
+    img = pcb_board(width, height, rng).astype(np.float32)
+
+    # Rotation about a random centre plus per-corner perspective jitter
+    cx = rng.uniform(diag / 2, width - diag / 2 + 1)
+    cy = rng.uniform(diag / 2, height - diag / 2 + 1)
+    src = np.float32([[0, 0], [lw, 0], [lw, lh], [0, lh]])
+    theta = np.deg2rad(params['rotation_deg'])
+    rot = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    jitter = rng.uniform(-1, 1, (4, 2)) * params['perspective'] * max(lw, lh)
+    dst = ((src - [lw / 2, lh / 2]) @ rot.T + jitter + [cx, cy]).astype(np.float32)
+    matrix = cv2.getPerspectiveTransform(src, dst)
+
+    warped = cv2.warpPerspective(label, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                                 borderValue=255)
+    alpha = cv2.warpPerspective(np.full_like(label, 255), matrix, (width, height),
+                                flags=cv2.INTER_LINEAR).astype(np.float32) / 255.0
+    img = img * (1 - alpha[..., None]) + warped.astype(np.float32)[..., None] * alpha[..., None]
+
+    if params['glare'] > 0:
+        gx, gy = (dst[rng.integers(0, 4)] + [cx, cy]) / 2     # between centre and a corner
+        radius = max(lw, lh) * rng.uniform(0.15, 0.4)
+        yy, xx = np.ogrid[:height, :width]
+        spot = np.exp(-((xx - gx) ** 2 + (yy - gy) ** 2) / (2 * radius ** 2))
+        img += (params['glare'] * 255.0 * spot)[..., None]
+    if params['blur_sigma'] > 0:
+        img = cv2.GaussianBlur(img, (0, 0), params['blur_sigma'])
+    if params['noise_std'] > 0:
+        img += rng.normal(0, params['noise_std'], img.shape)
+    img = np.clip(img + 0.5, 0, 255).astype(np.uint8)
+    return img, [(round(float(x), 1), round(float(y), 1)) for x, y in dst]
+
+
+def random_text(rng):
+    n = int(rng.integers(TEXT_LENGTH[0], TEXT_LENGTH[1] + 1))
+    return ''.join(TEXT_ALPHABET[i] for i in rng.integers(0, len(TEXT_ALPHABET), n))
+
+
+def generate_corpus(symbologies, count, ranges, seed=0, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """`count` labelled images per symbology. Symbologies whose encoder is unavailable are skipped."""
+    rng = np.random.default_rng(seed)
+    samples = []
+    skipped = {}
+    for sym in symbologies:
+        for i in range(count):
+            text = random_text(rng)
+            try:
+                symbol = ENCODERS[sym](text)
+            except ImportError as e:
+                skipped[sym] = f"encoder unavailable: {e}"
+                break
+            params = draw_params(rng, ranges)
+            img, quad = render_sample(rng, symbol, params, width, height)
+            samples.append({
+                'name': f"{sym}_{i:04d}",
+                'image': img,
+                'labels': [{'symbology': sym, 'text': text, 'quad': quad}],
+                'params': params,
+            })
+    return samples, skipped
+
+
+def save_corpus(samples, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    index = []
+    for s in samples:
+        cv2.imwrite(os.path.join(out_dir, s['name'] + '.png'), s['image'])
+        index.append({k: s[k] for k in ('name', 'labels', 'params')})
+    with open(os.path.join(out_dir, 'labels.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+
+
+def load_corpus(corpus_dir):
+    with open(os.path.join(corpus_dir, 'labels.json'), encoding='utf-8') as f:
+        index = json.load(f)
+    samples = []
+    for entry in index:
+        img = cv2.imread(os.path.join(corpus_dir, entry['name'] + '.png'), cv2.IMREAD_COLOR)
+        if img is None:
+            print("Skipping unreadable image:", entry['name'], file=sys.stderr)
+            continue
+        samples.append(dict(entry, image=img))
+    return samples
+
+
+# --- Pipelines ---
+# Each setup function returns run(image, timer) -> list of decoded texts, or
+# raises ImportError when the pipeline cannot run in this environment.
+
+def _require_backends(order):
+    import importlib
+    missing = []
+    for name in order:
+        try:
+            importlib.import_module(BACKEND_MODULES[name])
+        except Exception as e:
+            missing.append(f"{name} ({e})")
+    if len(missing) == len(order):
+        raise ImportError("no decoder backend available: " + ', '.join(missing))
+
+
+def setup_pyzbar():
+    """barcode.py: pyzbar on the whole frame."""
+    from decoder_cascade import decode_zbar
+    _require_backends(('zbar',))
+
+    def run(img, timer):
+        with timer.stage('decode'):
+            return [r['text'] for r in decode_zbar(img)]
+    return run
+
+
+def setup_classifier():
+    """barcode_classifier: region proposals, decode cascade, super-resolution fallback."""
+    import barcode_classifier as bc
+    _require_backends(bc.DECODER_ORDER)
+
+    def run(img, timer):
+        with timer.stage('cvtColor'):
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with timer.stage('detect'):
+            boxes = bc.detect_code_regions(gray)
+        texts = []
+        for x, y, w, h in boxes:
+            crop = img[y:y+h, x:x+w]
+            with timer.stage('decode'):
+                found = bc.decode_codes(crop)
+            if not found:
+                with timer.stage('super_resolve'):
+                    sr = bc.super_resolve(crop)
+                with timer.stage('decode_sr'):
+                    found = bc.decode_codes(sr)
+            texts += found
+        return texts
+    return run
+
+
+def setup_matrix_orig():
+    """matrix_decoder_orig: square-candidate detection, upscaled DataMatrix decode."""
+    import matrix_decoder_orig as md
+    _require_backends(md.decoder.order)
+
+    def run(img, timer):
+        with timer.stage('cvtColor'):
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with timer.stage('detect'):
+            boxes = md.detect_candidates(gray)
+        texts = []
+        for x, y, w, h in boxes:
+            with timer.stage('decode'):
+                texts += [r['text'] for r in md.decode_roi(gray[y:y+h, x:x+w])]
+        return texts
+    return run
+
+
+class StubRouter:
+    """
+    Offline stand-in for CaptureVisionRouter: same capture() call and result
+    accessors, decoded with pyzbar/pylibdmtx. Measures image_barcode's own
+    overhead (router pool, result cache, result collection) without the
+    Dynamsoft SDK or a license; in-memory images arrive as arrays.
+    """
+
+    def __init__(self, order=STUB_DECODER_ORDER):
+        from decoder_cascade import DecoderCascade
+        self.cascade = DecoderCascade(order)
+
+    def capture(self, source):
+        if isinstance(source, str):
+            img = cv2.imread(source, cv2.IMREAD_COLOR)
+        elif isinstance(source, (bytes, bytearray)):
+            img = cv2.imdecode(np.frombuffer(source, np.uint8), cv2.IMREAD_COLOR)
+        else:
+            img = source
+        return [SimpleNamespace(
+            get_text=lambda r=r: r['text'],
+            get_format_string=lambda r=r: r['format'],
+            get_confidence=lambda r=r: r['confidence'] or 0,
+            get_location=lambda r=r: SimpleNamespace(
+                points=[SimpleNamespace(x=x, y=y) for x, y in r['localization']]),
+        ) for r in self.cascade.decode(img)]
+
+
+def setup_image_barcode(stub=True):
+    """image_barcode.decode_array, with the Dynamsoft router replaced by StubRouter unless stub=False."""
+    import image_barcode
+    if stub:
+        _require_backends(STUB_DECODER_ORDER)
+        image_barcode.set_router_pool(image_barcode.RouterPool(1, factory=StubRouter))
+    else:
+        image_barcode.get_router_pool().warm()
+
+    def run(img, timer):
+        with timer.stage('decode_array'):
+            return [r['text'] for r in image_barcode.decode_array(img, use_cache=False) or []]
+    return run
+
+
+SETUPS = {
+    'pyzbar': setup_pyzbar,
+    'classifier': setup_classifier,
+    'matrix_orig': setup_matrix_orig,
+    'image_barcode': setup_image_barcode,
+}
+
+
+def run_pipeline(run, samples, warmup=1):
+    """Runs one pipeline over the corpus and scores it against the labels."""
+    for s in samples[:warmup]:
+        run(s['image'], StageMetrics(enabled=False))
+
+    timer = StageMetrics(enabled=True, window=STAGE_WINDOW_S)
+    per_sym = defaultdict(lambda: {'labels': 0, 'decoded': 0})
+    labels = decoded = false_positives = images_ok = errors = 0
+    start = time.perf_counter()
+    for s in samples:
+        try:
+            with timer.stage('total'):
+                texts = set(run(s['image'], timer))
+        except Exception as e:
+            print(f"Pipeline failed on {s['name']}: {e}", file=sys.stderr)
+            texts, errors = set(), errors + 1
+        expected = {l['text'] for l in s['labels']}
+        hits = expected & texts
+        labels += len(expected)
+        decoded += len(hits)
+        false_positives += len(texts - expected)
+        images_ok += int(hits == expected)
+        for l in s['labels']:
+            per_sym[l['symbology']]['labels'] += 1
+            per_sym[l['symbology']]['decoded'] += int(l['text'] in texts)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'images': len(samples),
+        'labels': labels,
+        'decoded': decoded,
+        'decode_rate': round(decoded / labels, 4) if labels else 0.0,
+        'image_success_rate': round(images_ok / len(samples), 4) if samples else 0.0,
+        'false_positives': false_positives,
+        'errors': errors,
+        'images_per_s': round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        'per_symbology': {
+            sym: dict(v, decode_rate=round(v['decoded'] / v['labels'], 4) if v['labels'] else 0.0)
+            for sym, v in sorted(per_sym.items())
+        },
+        'stages': timer.snapshot(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic barcode benchmark across all decode pipelines.')
+    parser.add_argument('--symbologies', nargs='+', choices=SYMBOLOGIES, default=list(SYMBOLOGIES))
+    parser.add_argument('--pipelines', nargs='+', choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument('--count', type=int, default=25, help='Images per symbology')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=FRAME_WIDTH)
+    parser.add_argument('--height', type=int, default=FRAME_HEIGHT)
+    for name, (lo, hi) in DEFAULT_RANGES.items():
+        parser.add_argument('--' + name.replace('_', '-'), dest=name, nargs=2, type=float, default=[lo, hi], metavar=('MIN', 'MAX'))
+    parser.add_argument('--corpus', help='Load a corpus saved with --save instead of generating one')
+    parser.add_argument('--save', help='Write the generated corpus (PNG + labels.json) here')
+    parser.add_argument('--dynamsoft', choices=('stub', 'real'), default='stub',
+                        help='image_barcode router: offline stub (default) or the licensed SDK')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed images per pipeline')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    ranges = {name: tuple(getattr(args, name)) for name in DEFAULT_RANGES}
+    skipped_symbologies = {}
+    if args.corpus:
+        samples = load_corpus(args.corpus)
+    else:
+        samples, skipped_symbologies = generate_corpus(
+            args.symbologies, args.count, ranges, args.seed, args.width, args.height)
+        if args.save:
+            save_corpus(samples, args.save)
+    if not samples:
+        print("No samples to benchmark.", file=sys.stderr)
+        sys.exit(1)
+
+    report = {
+        'corpus': {
+            'images': len(samples),
+            'source': args.corpus or 'generated',
+            'seed': args.seed,
+            'ranges': ranges,
+            'skipped_symbologies': skipped_symbologies,
+        },
+        'pipelines': {},
+    }
+    for name in args.pipelines:
+        # Pipelines print per-decode logs; keep stdout for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                if name == 'image_barcode':
+                    run = setup_image_barcode(stub=args.dynamsoft == 'stub')
+                else:
+                    run = SETUPS[name]()
+            except ImportError as e:
+                report['pipelines'][name] = {'skipped': str(e)}
+                continue
+            report['pipelines'][name] = run_pipeline(run, samples, args.warmup)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Fast board segmentation
+# -----------------------
+# Finds the PCB in a photo without the rembg network: the board is the dominant
+# green or blue hue (BOARD_HUE_BANDS), so
+#
+#   1. hue histogram of the saturated pixels -> peak inside a board band
+#   2. mask of peak +- SEGMENT_HUE_TOLERANCE, closed / opened with a kernel
+#      scaled to the image (bridges silkscreen, labels and components)
+#   3. largest connected component, holes filled
+#
+# all on a copy downscaled to SEGMENT_MAX_SIDE, which takes a few milliseconds
+# even for 12 MP frames. segment_board() returns the mask and a confidence in
+# [0, 1]; callers fall back to rembg below SEGMENT_MIN_CONFIDENCE (see
+# preprocess_pipeline.segment_stage). FAST_SEGMENT=0 always uses rembg.
+#
+# histogram_threshold() replaces the fixed binarisation level of 60: Otsu's
+# split of the gray histogram of the board pixels only.
+
+import os
+
+import cv2
+import numpy as np
+
+FAST_SEGMENT = os.environ.get('FAST_SEGMENT', '1') == '1'
+SEGMENT_MIN_CONFIDENCE = float(os.environ.get('SEGMENT_MIN_CONFIDENCE', '0.75'))
+SEGMENT_MAX_SIDE = 512      # Work size for the hue analysis (longest side, px)
+SEGMENT_MIN_SAT = 60        # Pixels below this saturation carry no usable hue
+SEGMENT_MIN_VAL = 30        # ...nor do near-black ones
+SEGMENT_HUE_TOLERANCE = 12  # OpenCV hue units (0-179) around the histogram peak
+SEGMENT_MIN_AREA = 0.15     # Board must cover at least this fraction of the frame
+SEGMENT_KERNEL_FRAC = 0.03  # Morphology kernel size as a fraction of the work size
+BOARD_HUE_BANDS = {'green': (35, 85), 'blue': (90, 130)}
+DEFAULT_THRESHOLD = 60      # Used when there are no board pixels to take a histogram of
+
+
+def dominant_board_hue(hsv):
+    """(band name, peak hue, share of all pixels in that band) or (None, None, 0.0)."""
+    valid = cv2.inRange(hsv, (0, SEGMENT_MIN_SAT, SEGMENT_MIN_VAL), (179, 255, 255))
+    hist = cv2.calcHist([hsv], [0], valid, [180], [0, 180]).ravel()
+    best = (None, None, 0.0)
+    for band, (lo, hi) in BOARD_HUE_BANDS.items():
+        share = hist[lo:hi + 1].sum() / hsv[:, :, 0].size
+        if share > best[2]:
+            best = (band, lo + int(np.argmax(hist[lo:hi + 1])), float(share))
+    return best
+
+
+def segment_board(img):
+    """
+    BGR image -> (uint8 mask at full size or None, confidence, info dict).
+    Confidence is the board's solidity (a board is a convex slab) scaled down
+    when less than half of it actually shows the board hue.
+    """
+    h, w = img.shape[:2]
+    scale = min(1.0, SEGMENT_MAX_SIDE / max(h, w))
+    # INTER_LINEAR: a few ms where INTER_AREA takes tens at 12 MP, and aliasing hardly moves a hue histogram
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR) if scale < 1.0 else img
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+
+    band, peak, share = dominant_board_hue(hsv)
+    info = {'band': band, 'hue': peak, 'hue_share': round(share, 3), 'confidence': 0.0}
+    if band is None or share < SEGMENT_MIN_AREA:
+        return None, 0.0, info
+
+    hue_mask = cv2.inRange(hsv, (max(0, peak - SEGMENT_HUE_TOLERANCE), SEGMENT_MIN_SAT, SEGMENT_MIN_VAL),
+                           (min(179, peak + SEGMENT_HUE_TOLERANCE), 255, 255))
+    k = max(3, int(max(small.shape[:2]) * SEGMENT_KERNEL_FRAC) | 1)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+    mask = cv2.morphologyEx(hue_mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if n < 2:
+        return None, 0.0, info
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    board = np.where(labels == largest, 255, 0).astype(np.uint8)
+    contours, _ = cv2.findContours(board, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    contour = max(contours, key=cv2.contourArea)
+    cv2.drawContours(board, [contour], -1, 255, cv2.FILLED)
+
+    area = cv2.countNonZero(board)
+    area_frac = area / board.size
+    hull_area = cv2.contourArea(cv2.convexHull(contour))
+    solidity = min(1.0, area / hull_area) if hull_area else 0.0
+    hue_frac = cv2.countNonZero(cv2.bitwise_and(hue_mask, board)) / max(1, area)
+    confidence = solidity * min(1.0, 2.0 * hue_frac) if area_frac >= SEGMENT_MIN_AREA else 0.0
+    info.update(area=round(area_frac, 3), solidity=round(solidity, 3),
+                hue_fraction=round(hue_frac, 3), confidence=round(confidence, 3))
+
+    if scale < 1.0:
+        board = cv2.resize(board, (w, h), interpolation=cv2.INTER_NEAREST)
+    return board, confidence, info
+
+
+def otsu_level(hist):
+    """Otsu threshold of a 256-bin histogram (values > level are foreground)."""
+    hist = np.asarray(hist, np.float64).ravel()
+    total = hist.sum()
+    if not total:
+        return None
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    m0 = np.cumsum(hist * levels)
+    w1 = total - w0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (m0[-1] * w0 - total * m0) ** 2 / (w0 * w1)
+    between[~np.isfinite(between)] = -1
+    return int(np.argmax(between))
+
+
+def histogram_threshold(gray, mask=None, default=DEFAULT_THRESHOLD):
+    """Binarisation level for `gray` from the histogram of the (masked) board pixels."""
+    hist = cv2.calcHist([gray], [0], mask, [256], [0, 256])
+    level = otsu_level(hist)
+    return default if level is None else level
@@ -0,0 +1,172 @@
+# Content-addressed decode cache
+# ------------------------------
+# The same label crop is decoded again and again (every frame, every preprocessing
+# variant). CropCache remembers decode results keyed by the image content so a
+# repeat costs one hash instead of a pylibdmtx / pyzbar / Dynamsoft call.
+#
+# Two key functions are provided:
+#   perceptual_key - gray dHash of the normalized crop + size bucket; tolerant to
+#                    sensor noise, meant for small ROI crops from live video.
+#   exact_key      - blake2b of the raw pixels/bytes; for whole images, where
+#                    boards of the same product would share a perceptual hash.
+#
+# A dHash cannot tell two serial labels apart that differ by one character, so
+# with perceptual_key every entry also keeps a small normalized thumbnail of the
+# crop it was decoded from. A hit is only returned when the new crop's thumbnail
+# matches it pixel for pixel within VERIFY_MAX_DIFF (sensor noise passes, a
+# changed character or a shifted crop does not and is decoded again).
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 16              # dHash grid (HASH_SIZE x HASH_SIZE bits)
+DHASH_MARGIN = 12           # Gradient (after normalization) a dHash bit needs; flat areas hash to 0
+SIZE_BUCKET = 16            # Crops whose sides differ by less than this share a bucket
+MAX_ENTRIES = 4096
+MAX_BYTES = 16 * 1024 * 1024
+TTL = 300.0                 # Seconds a decoded result stays valid
+EMPTY_TTL = 2.0             # Seconds a "nothing decoded" result stays valid
+ENTRY_OVERHEAD = 200        # Rough per-entry bookkeeping cost in bytes
+VERIFY_SIZE = (96, 48)      # Thumbnail (w, h) kept per entry to verify perceptual hits
+VERIFY_MAX_DIFF = 32        # Largest per-pixel difference (normalized gray) of a verified hit
+
+
+def perceptual_key(img: np.ndarray) -> bytes:
+    """Difference hash of the contrast-normalized gray crop, prefixed by its size bucket."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    h, w = gray.shape[:2]
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    small = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX).astype(np.int16)
+    bits = np.packbits(small[:, 1:] - small[:, :-1] > DHASH_MARGIN)
+    return f"{h // SIZE_BUCKET}x{w // SIZE_BUCKET}:".encode() + bits.tobytes()
+
+
+def thumbnail(img: np.ndarray) -> np.ndarray:
+    """Contrast-normalized VERIFY_SIZE gray thumbnail used to confirm a perceptual hit."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, VERIFY_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def thumbnails_match(a: np.ndarray, b: np.ndarray) -> bool:
+    return int(cv2.absdiff(a, b).max()) <= VERIFY_MAX_DIFF
+
+
+def exact_key(data) -> bytes:
+    """Hash of the exact content of an ndarray or bytes-like object."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(data, np.ndarray):
+        h.update(str((data.shape, data.dtype.str)).encode())
+        data = np.ascontiguousarray(data)
+    h.update(memoryview(data).cast('B'))
+    return h.digest()
+
+
+def _value_size(value) -> int:
+    if isinstance(value, (list, tuple)):
+        return ENTRY_OVERHEAD + sum(_value_size(v) for v in value)
+    if hasattr(value, 'keys'):     # dicts and barcode_result.BarcodeResult
+        return ENTRY_OVERHEAD + sum(_value_size(value[k]) for k in value.keys())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 16
+
+
+class CropCache:
+    """
+    Thread-safe LRU of decode results with entry-count, memory and TTL limits.
+    With `verify` (default: when keyed by perceptual_key), get() and put() take
+    the crop too and hits are confirmed against the stored thumbnail.
+    """
+
+    def __init__(self, key_func=perceptual_key, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 ttl=TTL, empty_ttl=EMPTY_TTL, verify=None):
+        self.key_func = key_func
+        self.verify = key_func is perceptual_key if verify is None else verify
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self._entries = OrderedDict()    # key -> (expires_at, size, value, thumbnail)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.collisions = 0
+
+    def _drop(self, key):
+        size = self._entries.pop(key)[1]
+        self.bytes -= size
+
+    def get(self, key, img=None):
+        """Return the cached value for `key`, or None (also when `img` fails verification)."""
+        thumb = thumbnail(img) if self.verify and img is not None else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.expired += 1
+                self.misses += 1
+                return None
+            if thumb is not None and entry[3] is not None and not thumbnails_match(thumb, entry[3]):
+                self.collisions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value, img=None):
+        ttl = self.ttl if value else self.empty_ttl
+        if ttl <= 0:
+            return
+        thumb = thumbnail(img) if self.verify and img is not None else None
+        size = len(key) + _value_size(value) + ENTRY_OVERHEAD + (thumb.nbytes if thumb is not None else 0)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value, thumb)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     self.bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_decode(self, img, decode):
+        """Return the cached result for `img`, or run `decode(img)` and cache it."""
+        key = self.key_func(img)
+        value = self.get(key, img)
+        if value is None:
+            value = decode(img)
+            if value is not None:
+                self.put(key, value, img)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expired': self.expired,
+                'collisions': self.collisions,
+            }
@@ -0,0 +1,423 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+from barcode_result import BarcodeResult
+from stage_metrics import StageMetrics
+
+# Local decode service
+# --------------------
+# asyncio HTTP server (stdlib only) in front of a pool of decoder processes that
+# keep their routers warm. Requests that arrive within BATCH_WINDOW_MS of each
+# other are decoded as one batch per worker round trip; the request queue is
+# bounded and answers 429 when full.
+#
+#   python decode_service.py --decoder dynamsoft --workers 4
+#   python decode_service.py --decoder stub          # offline, for load tests
+#
+#   POST /decode            body: image file bytes      -> {"results": [...], ...}
+#   POST /decode            body: {"path": "img.jpg"}   (Content-Type: application/json)
+#   GET  /decode?path=img.jpg
+#   GET  /health            GET /metrics (Prometheus)   GET /metrics.json
+#
+# Decoders: dynamsoft (image_barcode, licensed SDK), cascade (pyzbar + pylibdmtx),
+# stub (fixed result after STUB_DELAY_MS; text from STUB_BARCODE_TEXT).
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+BATCH_WINDOW_MS = 5.0       # How long a partial batch waits for more requests
+BATCH_MAX = 16              # Requests per worker round trip
+QUEUE_SIZE = 64             # Queued requests before 429
+MAX_BODY = 64 * 1024 * 1024 # Largest accepted upload
+STUB_DELAY_MS = float(os.environ.get('STUB_DELAY_MS', '20'))
+
+
+#---------------------------------------WORKER PROCESS-----------------------------------------------------#
+def _dynamsoft_decoder():
+    import image_barcode
+    from result_sinks import MemorySink
+    image_barcode.get_router_pool(1).warm()
+
+    def decode(kind, data, name):
+        if kind == 'path':
+            return image_barcode.decode_barcodes(data, sink=MemorySink())
+        return image_barcode.decode_bytes(data, name)
+    return decode
+
+
+def _read_image(kind, data):
+    import cv2
+    import numpy as np
+    if kind == 'path':
+        img = cv2.imread(data, cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("unreadable image")
+    return img
+
+
+def _cascade_decoder():
+    from decoder_cascade import DecoderCascade
+    cascade = DecoderCascade(('zbar', 'dmtx'))
+
+    def decode(kind, data, name):
+        return cascade.decode(_read_image(kind, data))
+    return decode
+
+
+def _stub_decoder():
+    text = os.environ.get('STUB_BARCODE_TEXT', 'STUB-0001')
+
+    def decode(kind, data, name):
+        h, w = _read_image(kind, data).shape[:2]
+        time.sleep(STUB_DELAY_MS / 1000.0)
+        return [BarcodeResult.from_box(text, (0, 0, w, h), 'CODE_39', 100)]
+    return decode
+
+
+DECODERS = {
+    'dynamsoft': _dynamsoft_decoder,
+    'cascade': _cascade_decoder,
+    'stub': _stub_decoder,
+}
+_worker_decode = None
+
+
+def _init_worker(decoder):
+    global _worker_decode
+    # Keep decoder chatter off the service's stdout
+    sys.stdout = sys.stderr
+    _worker_decode = DECODERS[decoder]()
+
+
+def _decode_batch(items):
+    """Runs in a worker: decodes (kind, data, name) items, one result tuple per item."""
+    out = []
+    for kind, data, name in items:
+        start = time.perf_counter()
+        try:
+            records = _worker_decode(kind, data, name)
+            if records is None:
+                out.append(('error', 'decode failed', 0.0))
+                continue
+            out.append(('ok', list(records), (time.perf_counter() - start) * 1000.0))
+        except Exception as e:
+            out.append(('error', str(e), 0.0))
+    return out
+
+
+#---------------------------------------HTTP SERVICE-------------------------------------------------------#
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 429: 'Too Many Requests', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class DecodeService:
+    def __init__(self, decoder='dynamsoft', workers=2, batch_window_ms=BATCH_WINDOW_MS,
+                 batch_max=BATCH_MAX, queue_size=QUEUE_SIZE, path_root=None):
+        self.decoder = decoder
+        self.workers = max(1, workers)
+        self.batch_window = batch_window_ms / 1000.0
+        self.batch_max = max(1, batch_max)
+        self.queue_size = queue_size
+        self.path_root = os.path.realpath(path_root) if path_root else None
+        self.metrics = StageMetrics(enabled=True)
+        self.counters = {'requests': 0, 'rejected': 0, 'errors': 0, 'batches': 0, 'batched_items': 0,
+                         'pool_restarts': 0}
+        self.started = time.time()
+        self.pool = None
+        self.queue = None
+        self._slots = None
+        self._batcher = None
+        self._restart_lock = None
+
+    # --- Batching ---
+    async def _collect_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()         # one batch in flight per worker
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.batch_max:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter_ns()
+        for item in batch:
+            self.metrics.record('queue_wait', now - item[4])
+        self.counters['batches'] += 1
+        self.counters['batched_items'] += len(batch)
+        pool = self.pool
+        try:
+            with self.metrics.stage('decode_batch'):
+                results = await loop.run_in_executor(
+                    pool, _decode_batch, [item[:3] for item in batch])
+        except BrokenProcessPool as e:
+            # A worker died (crash, OOM kill); every later submit would fail the same way
+            results = [('error', f"worker process died: {e}", 0.0)] * len(batch)
+            await self._restart_pool(pool)
+        except Exception as e:
+            results = [('error', f"worker failed: {e}", 0.0)] * len(batch)
+        finally:
+            self._slots.release()
+        for item, result in zip(batch, results):
+            if not item[3].done():
+                item[3].set_result(result)
+
+    async def _start_pool(self):
+        """New worker pool with every worker (and its warm router) started."""
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.decoder,))
+        await asyncio.gather(*(loop.run_in_executor(pool, _decode_batch, [])
+                               for _ in range(self.workers)))
+        return pool
+
+    async def _restart_pool(self, broken):
+        async with self._restart_lock:
+            if self.pool is not broken:
+                return      # another batch already replaced it
+            print("Decoder worker died, restarting the pool", file=sys.stderr)
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.counters['pool_restarts'] += 1
+            try:
+                self.pool = await self._start_pool()
+            except Exception as e:
+                print("Pool restart failed:", e, file=sys.stderr)   # retried by the next batch
+
+    async def submit(self, kind, data, name):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((kind, data, name, future, time.perf_counter_ns()))
+        except asyncio.QueueFull:
+            self.counters['rejected'] += 1
+            raise HttpError(429, "decode queue is full, retry later")
+        return await future
+
+    # --- Endpoints ---
+    def _resolve_path(self, path):
+        full = os.path.realpath(path)
+        if self.path_root and os.path.commonpath([full, self.path_root]) != self.path_root:
+            raise HttpError(403, "path outside the allowed root")
+        if not os.path.isfile(full):
+            raise HttpError(404, f"no such file: {path}")
+        return full
+
+    async def _decode(self, method, query, headers, body):
+        if method == 'GET':
+            if 'path' not in query:
+                raise HttpError(400, "GET /decode needs ?path=")
+            kind, data = 'path', self._resolve_path(query['path'][0])
+        elif headers.get('content-type', '').startswith('application/json'):
+            try:
+                data = self._resolve_path(json.loads(body)['path'])
+            except (ValueError, KeyError, TypeError):
+                raise HttpError(400, 'expected {"path": "..."}')
+            kind = 'path'
+        elif body:
+            kind, data = 'bytes', body
+        else:
+            raise HttpError(400, "empty request body")
+
+        name = data if kind == 'path' else query.get('name', ['upload'])[0]
+        status, payload, decode_ms = await self.submit(kind, data, name)
+        if status != 'ok':
+            self.counters['errors'] += 1
+            raise HttpError(422, payload)
+        return 200, {'image': name, 'results': [r.to_record() for r in payload],
+                     'decode_ms': round(decode_ms, 2)}
+
+    def _health(self):
+        return 200, {
+            'status': 'ok',
+            'decoder': self.decoder,
+            'workers': self.workers,
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue_size,
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+
+    def _metrics_json(self):
+        c = self.counters
+        return dict(c, mean_batch_size=round(c['batched_items'] / c['batches'], 2) if c['batches'] else 0.0,
+                    queued=self.queue.qsize(), stages=self.metrics.snapshot())
+
+    def _metrics_text(self):
+        lines = [self.metrics.to_prometheus(prefix='decode_service_stage').rstrip('\n')]
+        for name, value in self.counters.items():
+            lines.append(f'# TYPE decode_service_{name}_total counter')
+            lines.append(f'decode_service_{name}_total {value}')
+        lines.append('# TYPE decode_service_queued gauge')
+        lines.append(f'decode_service_queued {self.queue.qsize()}')
+        return '\n'.join(lines) + '\n'
+
+    async def _route(self, method, target, headers, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == '/decode':
+            if method not in ('GET', 'POST'):
+                raise HttpError(405, "use GET or POST")
+            self.counters['requests'] += 1
+            with self.metrics.stage('request'):
+                return await self._decode(method, query, headers, body)
+        if method != 'GET':
+            raise HttpError(405, "use GET")
+        if url.path == '/health':
+            return self._health()
+        if url.path == '/metrics':
+            return 200, self._metrics_text()
+        if url.path == '/metrics.json':
+            return 200, self._metrics_json()
+        raise HttpError(404, f"no route for {url.path}")
+
+    # --- HTTP/1.1 plumbing ---
+    @staticmethod
+    async def _read_request(reader):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "malformed request line")
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = header.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if 'chunked' in headers.get('transfer-encoding', ''):
+            raise HttpError(411, "send a Content-Length")
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "malformed Content-Length")
+        if length < 0:
+            raise HttpError(400, "negative Content-Length")
+        if length > MAX_BODY:
+            raise HttpError(413, f"body larger than {MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive, extra_headers=()):
+        if isinstance(payload, str):
+            data, ctype = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            data, ctype = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                f"Content-Type: {ctype}",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head.extend(extra_headers)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                extra = ()
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, payload = await self._route(method, target, headers, body)
+                except HttpError as e:
+                    status, payload, keep_alive = e.status, {'error': str(e)}, e.status < 500
+                    if e.status == 429:
+                        extra = ('Retry-After: 1',)
+                    if e.status in (400, 411, 413):
+                        keep_alive = False          # the stream position is unknown
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    print("Request failed:", e, file=sys.stderr)
+                    status, payload, keep_alive = 500, {'error': str(e)}, False
+                self._write_response(writer, status, payload, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # --- Lifecycle ---
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._restart_lock = asyncio.Lock()
+        # Start every worker (and its warm router) before accepting requests
+        self.pool = await self._start_pool()
+        self._batcher = asyncio.create_task(self._collect_batches())
+
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass    # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Decode service ({self.decoder}, {self.workers} workers) on http://{host}:{port}",
+              file=sys.stderr)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            self._batcher.cancel()
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            print("Decode service stopped:", json.dumps(self.counters), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local HTTP barcode decode service.')
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--decoder', choices=sorted(DECODERS), default='dynamsoft')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument('--batch-max', type=int, default=BATCH_MAX)
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--path-root', help='Only decode file paths below this directory')
+    args = parser.parse_args()
+
+    service = DecodeService(args.decoder, args.workers, args.batch_window_ms, args.batch_max,
+                            args.queue_size, args.path_root)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
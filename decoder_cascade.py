@@ -0,0 +1,170 @@
+# Cascading barcode decoder
+# -------------------------
+# Runs the decode stacks we already use (pyzbar, pylibdmtx, Dynamsoft) one after
+# another on the same image and stops as soon as the expected symbologies / count
+# are found. Per-backend hit rate and latency histograms are kept so the cascade
+# order can be tuned from real data.
+#
+# Every backend returns barcode_result.BarcodeResult objects (text, format,
+# confidence, localization), the same type image_barcode returns.
+
+import bisect
+import threading
+import time
+
+import cv2
+
+from barcode_result import BarcodeResult
+
+DEFAULT_ORDER = ('zbar', 'dmtx', 'dynamsoft')   # cheapest first
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def normalize_format(fmt):
+    """'QR_CODE', 'QRCODE' and 'qr code' all become 'QRCODE'."""
+    return fmt.upper().replace('_', '').replace(' ', '').replace('-', '')
+
+
+def stop_reached(results, expected_formats=(), expected_count=None):
+    """
+    True once `results` hold every normalized format in `expected_formats` and
+    at least `expected_count` distinct texts; with neither set, any result will do.
+    """
+    if not results:
+        return False
+    if expected_formats:
+        found = {normalize_format(r['format']) for r in results}
+        if not set(expected_formats) <= found:
+            return False
+    if expected_count is not None:
+        return len({r['text'] for r in results}) >= expected_count
+    return True
+
+
+def _to_gray(img):
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+
+# --- Backends ---
+def decode_zbar(img):
+    """QR & 1D barcodes via pyzbar (8-bit gray input)."""
+    from pyzbar.pyzbar import decode as zbar_decode
+    results = []
+    for z in zbar_decode(_to_gray(img)):
+        x, y, w, h = z.rect
+        results.append(BarcodeResult(
+            z.data.decode('utf-8'), z.type, getattr(z, 'quality', None),
+            [(p.x, p.y) for p in z.polygon] or [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]))
+    return results
+
+
+def decode_dmtx(img, timeout=None, max_count=None):
+    """DataMatrix via pylibdmtx."""
+    from pylibdmtx.pylibdmtx import decode as dmtx_decode
+    height = img.shape[0]
+    results = []
+    for r in dmtx_decode(img, timeout=timeout, max_count=max_count):
+        x, w, h = r.rect.left, r.rect.width, r.rect.height
+        y = height - r.rect.top - h   # libdmtx measures from the bottom edge
+        results.append(BarcodeResult.from_box(r.data.decode('utf-8'), (x, y, x + w, y + h), 'DATAMATRIX'))
+    return results
+
+
+def decode_dynamsoft(img):
+    """All formats enabled in template.json via the pooled Dynamsoft router."""
+    import image_barcode
+    return image_barcode.decode_array(img) or []
+
+
+BACKENDS = {
+    'zbar': decode_zbar,
+    'dmtx': decode_dmtx,
+    'dynamsoft': decode_dynamsoft,
+}
+
+
+# --- Statistics ---
+class BackendStats:
+    """Call/hit counters and a fixed-bucket latency histogram for one backend."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms, hit, error=False):
+        self.calls += 1
+        self.hits += int(hit)
+        self.errors += int(error)
+        self.total_ms += elapsed_ms
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def as_dict(self):
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'calls': self.calls,
+            'hits': self.hits,
+            'errors': self.errors,
+            'hit_rate': round(self.hits / self.calls, 4) if self.calls else 0.0,
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'latency_histogram': dict(zip(labels, self.histogram)),
+        }
+
+
+# --- Cascade ---
+class DecoderCascade:
+    """
+    Tries backends in `order` and stops once the results satisfy the stop rule:
+      - expected_formats: every listed symbology has been found, and/or
+      - expected_count:   at least this many distinct texts were found.
+    With neither set, the first backend that finds anything wins.
+    """
+
+    def __init__(self, order=DEFAULT_ORDER, expected_formats=None, expected_count=None,
+                 backends=None):
+        self.backends = dict(BACKENDS, **(backends or {}))
+        unknown = [name for name in order if name not in self.backends]
+        if unknown:
+            raise ValueError(f"Unknown decoder backend(s): {unknown}")
+        self.order = tuple(order)
+        self.expected_formats = {normalize_format(f) for f in (expected_formats or ())}
+        self.expected_count = expected_count
+        self.stats = {name: BackendStats(name) for name in self.order}
+        self._lock = threading.Lock()
+
+    def _satisfied(self, results):
+        return stop_reached(results, self.expected_formats, self.expected_count)
+
+    def decode(self, img):
+        """Run the cascade on a gray or BGR image and return the merged results."""
+        merged = {}
+        for name in self.order:
+            start = time.perf_counter()
+            error = False
+            try:
+                found = self.backends[name](img)
+            except Exception as e:
+                print(f"Decoder backend '{name}' failed: {e}")
+                found, error = [], True
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            with self._lock:
+                self.stats[name].record(elapsed_ms, bool(found), error)
+
+            for r in found:
+                merged.setdefault(r['text'], r)
+            if self._satisfied(list(merged.values())):
+                break
+        return list(merged.values())
+
+    def decode_texts(self, img):
+        return [r['text'] for r in self.decode(img)]
+
+    def report(self):
+        """Per-backend stats, in cascade order."""
+        with self._lock:
+            return {name: self.stats[name].as_dict() for name in self.order}
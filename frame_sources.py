@@ -0,0 +1,275 @@
+# Frame sources
+# -------------
+# Drop-in replacements for cv2.VideoCapture (read / set / isOpened / release), so
+# every scanner can run on a camera, a recorded video, a folder of images such as
+# sample_images/, or a synthetic generator, and be replayed offline in CI.
+#
+# Pick the source with the FRAME_SOURCE environment variable:
+#   FRAME_SOURCE=1                    camera index 1
+#   FRAME_SOURCE=recording.mp4        video file
+#   FRAME_SOURCE=sample_images        image folder
+#   FRAME_SOURCE=synthetic:1280x720   synthetic frames
+# and the pacing with FRAME_PACING=realtime (default for non-camera sources: fast).
+
+import os
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+DEFAULT_FPS = 30.0
+IMAGE_CACHE_MB = float(os.environ.get('IMAGE_CACHE_MB', '512'))   # Decoded images kept when looping a folder
+
+
+def pcb_board(width, height, rng, traces=60):
+    """Plain PCB-like background: solder-mask green with random copper traces."""
+    board = np.zeros((height, width, 3), np.uint8)
+    board[:] = (40, 110, 30)   # BGR solder-mask green
+    for _ in range(traces):
+        p1 = tuple(int(v) for v in rng.integers(0, [width, height]))
+        p2 = tuple(int(v) for v in rng.integers(0, [width, height]))
+        cv2.line(board, p1, p2, (60, 150, 70), int(rng.integers(1, 4)))
+    return board
+
+
+class FrameSource:
+    """
+    Base class. With realtime=True frames are delivered at `fps` (replay at
+    camera speed); otherwise as fast as the consumer reads them.
+    `live` sources may drop frames the consumer did not keep up with; replayed
+    sources in fast mode are lossless.
+    """
+
+    live = False
+
+    def __init__(self, realtime=False, fps=DEFAULT_FPS):
+        self.realtime = realtime
+        self.fps = fps or DEFAULT_FPS
+        self.frames_read = 0
+        self._next_time = None
+        if realtime:
+            self.live = True
+
+    def _pace(self):
+        if not self.realtime:
+            return
+        now = time.perf_counter()
+        if self._next_time is None:
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time = max(self._next_time, now - 1.0 / self.fps) + 1.0 / self.fps
+
+    def _next_frame(self):
+        raise NotImplementedError
+
+    def read(self, image=None):
+        """cv2.VideoCapture-compatible read; fills `image` in place when shapes match."""
+        ok, frame = self._next_frame()
+        if not ok:
+            return False, None
+        self._pace()
+        self.frames_read += 1
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    """A physical camera (cv2.VideoCapture), always live."""
+
+    live = True
+
+    def __init__(self, index=0, width=None, height=None, buffer_size=None, api=cv2.CAP_ANY):
+        super().__init__(realtime=False)
+        self.cap = cv2.VideoCapture(index, api)
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if buffer_size:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+    def read(self, image=None):
+        if image is None:
+            return self.cap.read()
+        return self.cap.read(image=image)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """Frames from a recorded video, optionally looped; paced at the file's FPS in realtime mode."""
+
+    def __init__(self, path, loop=False, realtime=False):
+        self.cap = cv2.VideoCapture(path)
+        super().__init__(realtime, self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS)
+        self.loop = loop
+
+    def _next_frame(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    """
+    Images of a folder (e.g. sample_images/) in name order. When looping, decoded
+    images are kept in an LRU of at most `cache_mb` so later passes skip imread;
+    a single pass reads each image once and keeps nothing.
+    """
+
+    def __init__(self, path, loop=False, realtime=False, fps=DEFAULT_FPS, width=None, height=None,
+                 cache_mb=IMAGE_CACHE_MB):
+        super().__init__(realtime, fps)
+        self.paths = [os.path.join(path, n) for n in sorted(os.listdir(path))
+                      if n.lower().endswith(IMAGE_EXTENSIONS)]
+        self.loop = loop
+        self.size = (width, height) if width and height else None
+        self.cache_bytes = int(cache_mb * 2 ** 20) if loop else 0
+        self._cache = OrderedDict()     # path -> decoded frame (None if unreadable)
+        self._cached_bytes = 0
+        self._index = 0
+
+    def _read(self, path):
+        frame = cv2.imread(path, cv2.IMREAD_COLOR)
+        if frame is not None and self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _load(self, path):
+        """(frame, cached): cached frames are shared and must be copied before handing out."""
+        if path in self._cache:
+            self._cache.move_to_end(path)
+            return self._cache[path], True
+        frame = self._read(path)
+        size = frame.nbytes if frame is not None else 0
+        if not self.cache_bytes or size > self.cache_bytes:
+            return frame, False
+        self._cache[path] = frame
+        self._cached_bytes += size
+        while self._cached_bytes > self.cache_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._cached_bytes -= old.nbytes if old is not None else 0
+        return frame, True
+
+    def _next_frame(self):
+        while self._index < len(self.paths) or (self.loop and self.paths):
+            if self._index >= len(self.paths):
+                self._index = 0
+            path = self.paths[self._index]
+            self._index += 1
+            frame, cached = self._load(path)
+            if frame is not None:
+                return True, frame.copy() if cached else frame   # consumers draw on their frame
+        return False, None
+
+    def isOpened(self):
+        return bool(self.paths)
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated PCB-like frames: green board texture with a few square, DataMatrix-like
+    module grids drifting slowly, plus sensor noise. Deterministic for a given seed.
+    """
+
+    def __init__(self, width=1280, height=720, count=None, codes=4, modules=14,
+                 module_px=6, seed=0, realtime=False, fps=DEFAULT_FPS):
+        super().__init__(realtime, fps)
+        self.width, self.height = width, height
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        self.board = pcb_board(width, height, self.rng)
+        # Keep each code within half the frame
+        module_px = max(1, min(module_px, min(width, height) // (2 * (modules + 2))))
+        self.codes = [self._code(modules, module_px) for _ in range(codes)]
+        side = (modules + 2) * module_px
+        self.positions = self.rng.uniform(
+            [0, 0], [max(1, width - side), max(1, height - side)], size=(codes, 2))
+        self.velocity = self.rng.normal(0, 0.5, size=(codes, 2))
+        self.frame = np.empty((height, width, 3), np.uint8)
+        self.noise = np.empty((height, width, 3), np.int16)
+
+    def _code(self, modules, module_px):
+        grid = self.rng.integers(0, 2, (modules, modules), dtype=np.uint8)
+        grid[:, 0] = 1                 # DataMatrix-style "L" finder
+        grid[-1, :] = 1
+        grid[0, ::2] = 1               # and alternating timing edges
+        grid[1::2, -1] = 1
+        img = np.where(grid == 1, 0, 255).astype(np.uint8)
+        img = cv2.resize(img, None, fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+        img = cv2.copyMakeBorder(img, module_px, module_px, module_px, module_px,
+                                 cv2.BORDER_CONSTANT, value=255)
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+    def _next_frame(self):
+        if self.count is not None and self.frames_read >= self.count:
+            return False, None
+        np.copyto(self.frame, self.board)
+        self.positions += self.velocity
+        for code, pos in zip(self.codes, self.positions):
+            h, w = code.shape[:2]
+            x = int(np.clip(pos[0], 0, self.width - w))
+            y = int(np.clip(pos[1], 0, self.height - h))
+            self.frame[y:y+h, x:x+w] = code
+        self.noise[:] = self.rng.integers(-6, 7, self.noise.shape, dtype=np.int16)
+        np.clip(self.frame + self.noise, 0, 255, out=self.noise)
+        return True, self.noise.astype(np.uint8)
+
+
+def open_source(spec=None, default=0, width=None, height=None, buffer_size=None,
+                realtime=None, loop=False):
+    """
+    Opens a frame source from `spec`, the FRAME_SOURCE environment variable, or
+    `default` (usually the script's camera index), in that order.
+    """
+    spec = spec if spec is not None else os.environ.get('FRAME_SOURCE', default)
+    if realtime is None:
+        realtime = os.environ.get('FRAME_PACING', 'fast') == 'realtime'
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec), width, height, buffer_size)
+    spec = str(spec)
+    if spec.startswith('synthetic'):
+        w, h = width or 1280, height or 720
+        if ':' in spec:
+            w, h = (int(v) for v in spec.split(':', 1)[1].lower().split('x'))
+        return SyntheticSource(w, h, realtime=realtime)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, loop=loop, realtime=realtime, width=width, height=height)
+    return VideoFileSource(spec, loop=loop, realtime=realtime)
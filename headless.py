@@ -0,0 +1,67 @@
+# Headless scanner mode
+# ---------------------
+# Shared by the live scanners (barcode_classifier, matrix_decoder_orig, barcode2).
+# With HEADLESS=1 they open no window and draw nothing; decoded codes go to the
+# result sinks named in RESULT_SINKS (see result_sinks.open_sinks), e.g.
+#
+#   HEADLESS=1 RESULT_SINKS=stdout,sqlite:line3.db python barcode_classifier.py
+#
+# SIGINT / SIGTERM (SIGBREAK on Windows) set `stop_event`, which every scanner
+# thread polls, so the capture, decode and sink threads all finish cleanly.
+
+import os
+import signal
+import sys
+import threading
+
+from result_sinks import open_sinks
+
+HEADLESS = os.environ.get('HEADLESS', '0') == '1'
+RESULT_SINKS = os.environ.get('RESULT_SINKS', 'stdout' if HEADLESS else '')
+
+stop_event = threading.Event()
+
+
+def install_signal_handlers(event=stop_event):
+    """Route termination signals to `event` (call from the main thread)."""
+    def handler(signum, frame):
+        print(f"Signal {signum} received, shutting down.")
+        event.set()
+
+    for name in ('SIGINT', 'SIGTERM', 'SIGBREAK', 'SIGHUP'):
+        sig = getattr(signal, name, None)
+        if sig is not None:
+            signal.signal(sig, handler)
+
+
+def open_result_sink(spec=RESULT_SINKS):
+    """
+    Opens the configured sinks (None if there are none). When results go to
+    stdout, the scanners' own console logging is moved to stderr so stdout
+    stays pure JSON lines.
+    """
+    sink = open_sinks(spec)
+    if any(part.strip() == 'stdout' for part in (spec or '').split(',')):
+        sys.stdout = sys.stderr
+    return sink
+
+
+def box_record(text, box, fmt=None, confidence=None):
+    """Sink record for a code found in an (x, y, w, h) box."""
+    x, y, w, h = (int(v) for v in box)
+    return {
+        'text': text,
+        'format': fmt,
+        'confidence': confidence,
+        'localization': [(x, y), (x + w, y), (x + w, y + h), (x, y + h)],
+    }
+
+
+def emit(sink, label, records):
+    """Send the records of one frame (labelled e.g. "pcb_scanner#1234") to `sink`."""
+    if sink is None or not records:
+        return
+    sink.begin(label)
+    for record in records:
+        sink.add(record)
+    sink.end()
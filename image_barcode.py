@@ -1,115 +1,336 @@
 import json
 import os
-import xml.etree.ElementTree as ET
-from datetime import datetime
+import queue
+import threading
+from contextlib import contextmanager
 from _collections_abc import Iterable
-from dynamsoft_barcode_reader_bundle import (
-    CaptureVisionRouter,
-    EnumBarcodeFormat,
-    LicenseManager,
-    EnumErrorCode
-)
+import numpy as np
+from barcode_result import BarcodeResult
+from crop_cache import CropCache, exact_key
+from result_sinks import MemorySink, XmlSink
+from stage_metrics import metrics
+from tiled_decode import TILE_WORKERS, TILED_DECODE, decode_tiles, should_tile
 
 LICENSE_KEY = 't0083YQEAAKqisPaOrLvM0tGYIFZd04VlwkQPvSCAZ4R2+kDWpFzDsEKVbxLkbhN4noJKQL+E0fMaU/Pmjx9bxkBIbeFwualmfM803jOjFTODC/izSGg=;t0082YQEAAEOa7iWLgmj5HwcSP7J0uNaMQ/kZ/x8HgwPBUpUE8rgwZj8s7nrHomUArjOIL611KRz1gqlYYYTZ98clI+D2lvWM75vifTOySIIddlJJAg==;t0082YQEAAA/YSn4DjmzJcu2C2qrVkNFVQ3pbrfwAi+IqrxbxV31mVURD6/IhsMOj+eYszSaE4PXkcuJ0GyOjRmygD4xAkHAZ3zfF+2bULAkOfcdJCQ=='
 TEMPLATE_PATH  = os.path.join(os.path.dirname(__file__), 'template.json')
+# Routers kept warm per process; tiled decoding wants one per tile worker
+ROUTER_POOL_SIZE = int(os.environ.get('ROUTER_POOL_SIZE', str(TILE_WORKERS if TILED_DECODE else 1)))
 
-SELECTED_FORMATS = (
-    EnumBarcodeFormat.BF_ONED
-    | EnumBarcodeFormat.BF_QR_CODE
-    | EnumBarcodeFormat.BF_DATAMATRIX
-    | EnumBarcodeFormat.BF_PDF417
-    | EnumBarcodeFormat.BF_CODE_39
-    | EnumBarcodeFormat.BF_CODE_128
-)
+# In-memory decodes are cached by exact content: whole boards of one product
+# look alike, so a perceptual key could hand back another board's serials.
+result_cache = CropCache(key_func=exact_key, max_entries=256)
+
+
+def __getattr__(name):
+    # SELECTED_FORMATS (the format mask the templates are tuned for) stays importable
+    # for external scripts, but is only built on first access so that importing
+    # this module does not need the Dynamsoft SDK
+    if name == 'SELECTED_FORMATS':
+        from dynamsoft_barcode_reader_bundle import EnumBarcodeFormat
+        value = globals()['SELECTED_FORMATS'] = (
+            EnumBarcodeFormat.BF_ONED
+            | EnumBarcodeFormat.BF_QR_CODE
+            | EnumBarcodeFormat.BF_DATAMATRIX
+            | EnumBarcodeFormat.BF_PDF417
+            | EnumBarcodeFormat.BF_CODE_39
+            | EnumBarcodeFormat.BF_CODE_128
+        )
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 #---------------------------------------API CONNECTION-------------------------------------------------------#
+_license_lock = threading.Lock()
+_license_ready = False
+
+_template_lock = threading.Lock()
+_template_cache = {'mtime': None, 'settings': None}
+
+
+def init_license():
+    """Initialize the Dynamsoft license once per process."""
+    global _license_ready
+    from dynamsoft_barcode_reader_bundle import EnumErrorCode, LicenseManager
+    with _license_lock:
+        if _license_ready:
+            return
+        err, msg = LicenseManager.init_license(LICENSE_KEY)
+        print("License init:", msg)
+        if err not in (EnumErrorCode.EC_OK, EnumErrorCode.EC_LICENSE_CACHE_USED):
+            raise RuntimeError(f"License init failed ({err}): {msg}")
+        _license_ready = True
+
+
+def load_template_settings():
+    """
+    Returns (mtime, settings_json) for template.json.
+    The file is only parsed again when its modification time changes.
+    """
+    mtime = os.path.getmtime(TEMPLATE_PATH)
+    with _template_lock:
+        if _template_cache['mtime'] != mtime:
+            with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+                cfg = json.load(f)
+            _template_cache['settings'] = json.dumps(cfg)
+            _template_cache['mtime'] = mtime
+        return _template_cache['mtime'], _template_cache['settings']
+
+
 def init_router():
-    # 1) Init license
-    err, msg = LicenseManager.init_license(LICENSE_KEY)
-    print("License init:", msg)
-    if err not in (EnumErrorCode.EC_OK, EnumErrorCode.EC_LICENSE_CACHE_USED):
-        raise RuntimeError(f"License init failed ({err}): {msg}")
+    # 1) Init license (no-op after the first call)
+    init_license()
 
     # 2) Create router
+    from dynamsoft_barcode_reader_bundle import CaptureVisionRouter
     router = CaptureVisionRouter()
 
-    # 3) Load your full JSON config
-    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-        cfg = json.load(f)
-
-    # 4) Apply it
-    router.init_settings(json.dumps(cfg))
+    # 3) Apply the cached JSON config
+    _, settings = load_template_settings()
+    router.init_settings(settings)
 
     return router
 
+
+class RouterPool:
+    """
+    Process-wide pool of warm CaptureVisionRouter instances.
+    A router is only used by one caller at a time; up to `size` routers are
+    created on demand and handed out again after each capture.
+    """
+
+    def __init__(self, size=ROUTER_POOL_SIZE, factory=None):
+        self.size = max(1, int(size))
+        self.factory = factory      # alternative router constructor, e.g. an offline stub
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _new_entry(self):
+        if self.factory is not None:
+            return [self.factory(), None]
+        from dynamsoft_barcode_reader_bundle import CaptureVisionRouter
+        init_license()
+        mtime, settings = load_template_settings()
+        router = CaptureVisionRouter()
+        router.init_settings(settings)
+        return [router, mtime]
+
+    def acquire(self, timeout=None):
+        try:
+            entry = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    return self._new_entry()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            entry = self._idle.get(timeout=timeout)
+
+        if self.factory is not None:
+            return entry
+        # Re-apply settings only if template.json changed since this router was set up
+        mtime, settings = load_template_settings()
+        if entry[1] != mtime:
+            entry[0].init_settings(settings)
+            entry[1] = mtime
+        return entry
+
+    def release(self, entry):
+        self._idle.put(entry)
+
+    @contextmanager
+    def router(self, timeout=None):
+        entry = self.acquire(timeout)
+        try:
+            yield entry[0]
+        finally:
+            self.release(entry)
+
+    def warm(self):
+        """Create every router up front so the first captures don't pay for setup."""
+        entries = [self.acquire() for _ in range(self.size)]
+        for entry in entries:
+            self.release(entry)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_router_pool(size=None):
+    """Return the process-wide RouterPool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RouterPool(size or ROUTER_POOL_SIZE)
+        return _pool
+
+
+def set_router_pool(pool):
+    """Replace the process-wide pool (e.g. RouterPool(factory=StubRouter) for offline runs)."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
+
 #--------------------------------------DECODER FUNCTION-------------------------------------------------------#
-def decode_barcodes(image_path):
-    # Initialize the router
+def _capture(source, quiet=False):
+    """Runs one capture on a pooled router. `source` is a path, encoded bytes, ImageData or an array (stub routers)."""
+    # Borrow a warm router from the pool
     try:
-        router = init_router()
-        print("Router initialized.")
+        pool = get_router_pool()
+        entry = pool.acquire()
     except Exception as e:
         print("Failed during init_router:", e)
-        return
+        return None
 
     try:
-        results = router.capture(image_path)
-        print("Capture complete.")
+        results = entry[0].capture(source)
+        if not quiet:
+            print("Capture complete.")
+        return results
     except Exception as e:
         print("Failed during capture:", e)
-        return
+        return None
+    finally:
+        pool.release(entry)
 
-    decoded = []
 
-    # Create XML root
-    root = ET.Element('Barcodes')
-    root.set('image', os.path.basename(image_path))
-    root.set('timestamp', datetime.now().isoformat())
+def _print_results(decoded):
+    """Console log of one image's results."""
+    for n, r in enumerate(decoded, 1):
+        print("")  # blank space for readability
+        print(f"Detected code {n}:")
+        print(f"  Text        : {r.text}")
+        print(f"  Format      : {r.format}")
+        print(f"  Confidence  : {r.confidence}")
+        print(f"  Localization: {list(r.localization)}")
+    if not decoded:
+        print("No barcodes detected.")
+
+
+def _collect(results, image_name, sink, quiet=False):
+    """SDK results -> BarcodeResults in `sink`; quiet=True skips the console log (tiles)."""
+    sink.begin(image_name)
 
     for idx, res in enumerate(results):
         try:
-            print("")  # blank space for readability
-            text = res.get_text()
-            fmt = res.get_format_string()
-            confidence = res.get_confidence()
             location = res.get_location()  # quadrilateral
             points = [(pt.x, pt.y) for pt in location.points]
-
-            decoded.append({
-                'text': text,
-                'format': fmt,
-                'confidence': confidence,
-                'localization': points
-            })
-
-            # XML entry
-            bc_elem = ET.SubElement(root, 'Barcode', id=str(len(decoded)))
-            ET.SubElement(bc_elem, 'Text').text = text
-            ET.SubElement(bc_elem, 'Format').text = fmt
-            ET.SubElement(bc_elem, 'Confidence').text = str(confidence)
-            loc_elem = ET.SubElement(bc_elem, 'Localization')
-            for i, (x, y) in enumerate(points):
-                pt_elem = ET.SubElement(loc_elem, 'Point', index=str(i))
-                ET.SubElement(pt_elem, 'X').text = str(x)
-                ET.SubElement(pt_elem, 'Y').text = str(y)
-
-            # Console log
-            print(f"Detected code {len(decoded)}:")
-            print(f"  Text        : {text}")
-            print(f"  Format      : {fmt}")
-            print(f"  Confidence  : {confidence}")
-            print(f"  Localization: {points}")
-
-            # Write XML to file
-            xml_path = os.path.splitext(image_path)[0] + '_results.xml'
-            tree = ET.ElementTree(root)
-            tree.write(xml_path, encoding='utf-8', xml_declaration=True)
-            print(f"Results saved to XML: {xml_path}")
-
+            sink.add(BarcodeResult(res.get_text(), res.get_format_string(), res.get_confidence(), points))
         except Exception as e:
             print(f"Failed {idx}: {e}")
 
-    if not decoded:
-        print("No barcodes detected.")
+    decoded = sink.end()
+    if not quiet:
+        _print_results(decoded)
+    return decoded
+
+
+def to_image_data(img):
+    """Wraps a uint8 OpenCV image (gray, BGR or BGRA) as Dynamsoft ImageData without re-encoding."""
+    from dynamsoft_barcode_reader_bundle import EnumImagePixelFormat, ImageData
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = img[:, :, :3]
+    img = np.ascontiguousarray(img, dtype=np.uint8)
+    h, w = img.shape[:2]
+    if img.ndim == 2:
+        return ImageData(img.tobytes(), w, h, w, EnumImagePixelFormat.IPF_GRAYSCALED)
+    return ImageData(img.tobytes(), w, h, w * 3, EnumImagePixelFormat.IPF_BGR_888)
+
+
+def _array_source(img):
+    """ImageData for the SDK routers; a pool built with a stub factory takes the array as is."""
+    return img if get_router_pool().factory is not None else to_image_data(img)
+
+
+def _replay(records, name, sink):
+    sink.begin(name)
+    for rec in records:
+        sink.add(rec)
+    return sink.end()
+
+
+def _decode_tile(tile):
+    # Runs on the tile threads: silent, decode_tiled logs the merged result once
+    results = _capture(_array_source(tile), quiet=True)
+    return [] if results is None else _collect(results, 'tile', MemorySink(), quiet=True)
+
+
+def decode_tiled(img, name='tiled', sink=None, quiet=False, **tiling):
+    """
+    Decodes a large in-memory image as overlapping tiles on the router pool
+    (see tiled_decode); quads are in image coordinates, border codes appear once.
+    """
+    with metrics.stage('decode_tiled'):
+        records = decode_tiles(img, _decode_tile, **tiling)
+    if not quiet:
+        _print_results(records)
+    return _replay(records, name, sink or MemorySink())
+
+
+def decode_barcodes(image_path, sink=None):
+    """
+    Decodes every barcode in `image_path`.
+    Results go to `sink` (see result_sinks); by default an XmlSink writes
+    `<image>_results.xml` once, after the last barcode.
+    With TILED_DECODE=1, large images are decoded tile by tile.
+    """
+    if TILED_DECODE:
+        import cv2
+        img = cv2.imread(image_path)
+        if img is not None:
+            # Already in memory: small images go to the router whole from here
+            return decode_array(img, image_path, sink or XmlSink(), use_cache=False)
+
+    with metrics.stage('decode_barcodes.capture'):
+        results = _capture(image_path)
+    if results is None:
+        return
+    with metrics.stage('decode_barcodes.collect'):
+        return _collect(results, image_path, sink or XmlSink())
+
+
+def _decode_cached(data, source, name, sink, use_cache, quiet=False):
+    key = exact_key(data) if use_cache else None
+    decoded = result_cache.get(key) if use_cache else None
+    if decoded is not None:
+        return _replay(decoded, name, sink or MemorySink())
+
+    if source is None:          # image large enough to tile
+        decoded = decode_tiled(data, name, sink, quiet)
+    else:
+        with metrics.stage('decode_array.capture'):
+            results = _capture(source(data), quiet)
+        if results is None:
+            return
+        with metrics.stage('decode_array.collect'):
+            decoded = _collect(results, name, sink or MemorySink(), quiet)
+    if use_cache:
+        result_cache.put(key, list(decoded))
+    return decoded
+
+
+def decode_array(img, name='array', sink=None, use_cache=True, quiet=False):
+    """
+    Decodes an in-memory image (e.g. the output of image_preprocess.process_image).
+    Nothing is written to disk unless a file sink is passed.
+    Identical images are answered from `result_cache`.
+    Large images are tiled when TILED_DECODE=1 (see decode_tiled).
+    quiet=True skips the per-image console log (video frames).
+    """
+    return _decode_cached(img, None if should_tile(img) else _array_source, name, sink, use_cache, quiet)
+
 
-    return decoded
\ No newline at end of file
+def decode_bytes(buf, name='buffer', sink=None, use_cache=True):
+    """Decodes an encoded image (JPEG/PNG/... file contents) held in memory."""
+    if TILED_DECODE:
+        import cv2
+        img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+        if img is not None and should_tile(img):
+            return decode_array(img, name, sink, use_cache)
+    return _decode_cached(buf, bytes, name, sink, use_cache)
@@ -2,15 +2,24 @@ import cv2
 import subprocess
 import tempfile
 import os
+import queue
+import threading
 import xml.etree.ElementTree as ET
+from barcode_result import BarcodeResult
+from frame_sources import open_source
+from stage_metrics import draw_overlay, metrics, report as report_metrics, start_exporter
 
-# Path to BarcodeReader CLI
-BARCODE_CLI_PATH = "C://Users//Admin//Downloads//BarcodeReaderCLI//bin//BarcodeReaderCLI.exe"
+# Path to BarcodeReader CLI (override with the BARCODE_CLI_PATH environment variable)
+BARCODE_CLI_PATH = os.environ.get(
+    "BARCODE_CLI_PATH", "C://Users//Admin//Downloads//BarcodeReaderCLI//bin//BarcodeReaderCLI.exe")
+DECODER_WORKERS = 2         # Decodes allowed in flight at once
+DECODER_BACKEND = os.environ.get("DECODER_BACKEND", "auto")    # auto | router | cli (per-frame spawn fallback)
+FRAME_EXT = ".bmp"          # uncompressed: much cheaper to write than JPEG
 
 def parse_barcode_xml(xml_output):
     """
     Parses the XML output from BarcodeReader CLI
-    Returns a list of dicts with barcode text and bounding box
+    Returns a list of BarcodeResults (b["text"], b["box"] as x1, y1, x2, y2)
     """
     results = []
     try:
@@ -22,17 +31,15 @@ def parse_barcode_xml(xml_output):
             top = int(rect.get("Top"))
             width = int(rect.get("Width"))
             height = int(rect.get("Height"))
-            results.append({
-                "text": text,
-                "box": (left, top, left + width, top + height)
-            })
+            results.append(BarcodeResult.from_box(
+                text, (left, top, left + width, top + height), barcode.findtext("Format")))
     except Exception as e:
         print("XML Parse Error:", e)
     return results
 
-def read_barcodes_from_image(image_path):
+def read_barcodes_from_image(image_path, command=None):
     args = []
-    args.append(BARCODE_CLI_PATH)   # Full path or relative path to the CLI
+    args.extend(command or [BARCODE_CLI_PATH])   # Full path or relative path to the CLI
     args.append("-type=code39")                     # (Optional) Restrict barcode type
     args.append(image_path)                          # The temp image saved from webcam
     args.append("-f")                                # Output format
@@ -46,46 +53,215 @@ def read_barcodes_from_image(image_path):
     )
     return cp.stdout, cp.stderr
 
+def decode_with_router(frame):
+    """Decodes a frame in-process on image_barcode's warm router pool (no file, no subprocess)."""
+    import image_barcode
+    # quiet: no per-frame "Capture complete." / "Detected code" log at camera rate
+    found = image_barcode.decode_array(frame, "frame", use_cache=False, quiet=True)
+    if found is None:
+        raise RuntimeError("router capture failed")
+    return [BarcodeResult.from_record(r) for r in found]
+
+def _router_available(workers):
+    """Warms image_barcode's router pool; False when the SDK or its license is unavailable."""
+    try:
+        import image_barcode
+        image_barcode.get_router_pool(workers).warm()
+        return True
+    except Exception as e:
+        print("Dynamsoft router unavailable, falling back to one BarcodeReaderCLI run per frame:", e)
+        return False
+
+def _frame_dir():
+    """RAM-backed directory for frame hand-off when available (tmpfs on Linux)."""
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class DecoderPool:
+    """
+    Decodes webcam frames on background workers so the capture loop never
+    waits for the decoder.
+
+    Only the newest submitted frame is kept: if the workers fall behind,
+    older frames are dropped before decoding, and results that come back
+    older than one already delivered are discarded.
+
+    `backend` is "router" (image_barcode's persistent Dynamsoft routers,
+    frames passed in memory; the fast path) or "cli": a fallback that still
+    spawns one BarcodeReaderCLI process per frame, as before the pool, so it
+    is no faster per decode. The pool only keeps those spawns off the capture
+    loop (each worker reuses a single frame file on tmpfs). "auto" picks the
+    routers when they can be set up, else the CLI. A frame that fails to decode is counted in `errors`
+    and reported; the worker carries on with the next frame.
+
+    `command` is the CLI invocation prefix, e.g.
+    [sys.executable, "stub_barcode_cli.py"] to run against the local stub;
+    passing one selects the CLI backend.
+    """
+
+    def __init__(self, workers=DECODER_WORKERS, command=None, frame_dir=None, backend=None):
+        backend = backend or ("cli" if command else DECODER_BACKEND)
+        if backend == "auto":
+            backend = "router" if _router_available(workers) else "cli"
+        if backend not in ("router", "cli"):
+            raise ValueError(f"Unknown decoder backend: {backend}")
+        self.backend = backend
+        self.command = list(command or [BARCODE_CLI_PATH])
+        self.frame_dir = frame_dir or _frame_dir()
+        self.results = queue.Queue()
+        self.submitted = 0
+        self.dropped = 0
+        self.decoded = 0
+        self.errors = 0
+        self._last_error = None
+        self._slot = None
+        self._last_seq = -1
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._paths = []
+        self._threads = []
+        for idx in range(workers):
+            path = os.path.join(self.frame_dir, f"barcode_frame_{os.getpid()}_{idx}{FRAME_EXT}")
+            self._paths.append(path)
+            t = threading.Thread(target=self._worker, args=(path,), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, frame, copy=True):
+        """Queue a frame for decoding and return its sequence number."""
+        if copy:
+            frame = frame.copy()  # the caller keeps drawing on its own frame
+        with self._cond:
+            seq = self.submitted
+            self.submitted += 1
+            if self._slot is not None:
+                self.dropped += 1
+            self._slot = (seq, frame)
+            self._cond.notify()
+        return seq
+
+    def _worker(self, path):
+        while True:
+            with self._cond:
+                while self._slot is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                seq, frame = self._slot
+                self._slot = None
+
+            try:
+                barcodes = self._decode(frame, path)
+            except Exception as e:
+                self._report_error(seq, e)
+                continue
+
+            with self._cond:
+                if seq < self._last_seq:
+                    self.dropped += 1   # a newer frame already finished
+                    continue
+                self._last_seq = seq
+                self.decoded += 1
+            self.results.put((seq, barcodes))
+
+    def _decode(self, frame, path):
+        if self.backend == "router":
+            with metrics.stage('decode_router'):
+                return decode_with_router(frame)
+        with metrics.stage('write_frame'):
+            written = cv2.imwrite(path, frame)
+        if not written:
+            raise OSError(f"failed to write frame {path}")
+        # A missing or broken CLI raises FileNotFoundError / OSError here
+        with metrics.stage('decode_cli'):
+            stdout, stderr = read_barcodes_from_image(path, self.command)
+        return parse_barcode_xml(stdout)
+
+    def _report_error(self, seq, error):
+        """Counts a failed frame; the message is printed when it differs from the last one."""
+        message = f"{type(error).__name__}: {error}"
+        with self._cond:
+            self.errors += 1
+            repeated = message == self._last_error
+            self._last_error = message
+        if not repeated:
+            print(f"Decode failed (frame {seq}, {self.backend}):", message)
+
+    def get(self, timeout=None):
+        """Return the next (seq, barcodes) result, or None if nothing arrived in time."""
+        try:
+            if timeout == 0:
+                return self.results.get_nowait()
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        for path in self._paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
 def main():
-    cap = cv2.VideoCapture(1)  # Webcam index
+    cap = open_source(default=1)  # Webcam index, or FRAME_SOURCE if set
 
     if not cap.isOpened():
         print("Cannot access camera.")
         return
 
     print("Press 'q' to quit.")
+    pool = DecoderPool()
+    barcodes = []
+    exporter = start_exporter()
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Save current frame to a temp image file
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
-            frame_path = tmp.name
-            cv2.imwrite(frame_path, frame)
-
-        # Read barcodes from this frame
-        stdout, stderr = read_barcodes_from_image(frame_path)
-        barcodes = parse_barcode_xml(stdout)
-
-        # Delete temp image
-        os.remove(frame_path)
-
-        # Draw boxes and text on frame
-        for b in barcodes:
-            x1, y1, x2, y2 = b["box"]
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(frame, b["text"], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
-                        0.6, (0, 255, 0), 2)
-            print("Detected:", b["text"])
-
-        # Show the video feed
-        cv2.imshow("Barcode Reader", frame)
-
-        # Quit on 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    try:
+        while True:
+            with metrics.stage('capture'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+
+            with metrics.stage('frame'):
+                # Hand the frame to the decoder workers and pick up any finished results
+                with metrics.stage('submit'):
+                    pool.submit(frame)
+                result = pool.get(timeout=0)
+                while result is not None:
+                    seq, barcodes = result
+                    for b in barcodes:
+                        print(f"Detected (frame {seq}):", b["text"])
+                    result = pool.get(timeout=0)
+
+                # Draw the latest boxes and text on frame
+                with metrics.stage('draw'):
+                    for b in barcodes:
+                        x1, y1, x2, y2 = b["box"]
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                        cv2.putText(frame, b["text"], (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                                    0.6, (0, 255, 0), 2)
+                    draw_overlay(frame, stages=('capture', 'submit', 'write_frame', 'decode_cli', 'decode_router', 'draw', 'imshow'))
+
+                # Show the video feed
+                with metrics.stage('imshow'):
+                    cv2.imshow("Barcode Reader", frame)
+                    key = cv2.waitKey(1) & 0xFF
+
+            # Quit on 'q'
+            if key == ord('q'):
+                break
+    finally:
+        pool.close()
+        print(f"Frames: {pool.submitted}, decoded: {pool.decoded}, dropped: {pool.dropped}, errors: {pool.errors}")
+        if exporter:
+            exporter.stop()
+        report_metrics()
 
     cap.release()
     cv2.destroyAllWindows()
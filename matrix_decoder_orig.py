@@ -1,93 +1,222 @@
 import cv2
 import numpy as np
-from pylibdmtx import pylibdmtx
-from threading import Thread
+import time
+from threading import Condition, Thread
+from decoder_cascade import DecoderCascade
+from roi_tracker import RoiTracker
+from crop_cache import CropCache
+from frame_sources import open_source
+from region_proposals import DETECT_SCALE, downscale, map_boxes, odd, propose_regions
+from stage_metrics import draw_overlay, metrics, report as report_metrics, start_exporter
+from headless import HEADLESS, box_record, emit, install_signal_handlers, open_result_sink, stop_event
+
+decoder = DecoderCascade(('dmtx',))
+crop_cache = CropCache()
 
 class VideoStream:
-    def __init__(self, src=1, width=640, height=480, buffer_size=1):
-        self.cap = cv2.VideoCapture(src, cv2.CAP_ANY)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+    """
+    Threaded camera reader with preallocated frame buffers.
+
+    Frames are captured straight into one of `buffers` arrays (cap.read(image=buf))
+    and tagged with a monotonically increasing frame_id and a perf_counter
+    capture timestamp. read() blocks until a frame newer than the last one it
+    returned is available, so consumers never process the same frame twice.
+    The buffer handed to the consumer is not reused until the next read();
+    frames overwritten before anyone read them are counted in `dropped`.
+    Replayed sources that are not paced in real time are read losslessly: the
+    reader waits for the consumer instead of dropping frames.
+    """
+
+    def __init__(self, src=1, width=640, height=480, buffer_size=1, buffers=3):
+        # Camera index by default; FRAME_SOURCE can swap in a video, image folder or synthetic feed
+        self.cap = open_source(default=src, width=width, height=height, buffer_size=buffer_size)
         self.stopped = False
-        self.grabbed, self.frame = self.cap.read()
+        self.grabbed, first = self.cap.read()
+        shape = first.shape if self.grabbed else (height, width, 3)
+        self.buffers = [np.empty(shape, np.uint8) for _ in range(max(3, buffers))]
+        self.frame_id = 0           # id of the newest captured frame
+        self.timestamp = 0.0        # perf_counter() when it was captured
+        self.captured = 0
+        self.dropped = 0
+        self._latest = None         # buffer index holding frame_id
+        self._held = None           # buffer index the consumer is using
+        self._last_read = 0         # frame_id last returned by read()
+        self._cond = Condition()
+        if self.grabbed:
+            np.copyto(self.buffers[0], first)
+            self._publish(0)
         Thread(target=self._update, daemon=True).start()
 
+    def _publish(self, index):
+        with self._cond:
+            if self._latest is not None and self.frame_id > self._last_read:
+                self.dropped += 1   # previous frame was never read
+            self.frame_id += 1
+            self.captured += 1
+            self.timestamp = time.perf_counter()
+            self._latest = index
+            self._cond.notify_all()
+
     def _update(self):
         while not self.stopped:
-            self.grabbed, self.frame = self.cap.read()
+            with self._cond:
+                if not self.cap.live:
+                    self._cond.wait_for(lambda: self.frame_id <= self._last_read or self.stopped)
+                index = next(i for i in range(len(self.buffers))
+                             if i != self._latest and i != self._held)
+            grabbed, img = self.cap.read(image=self.buffers[index])
+            if not grabbed:
+                with self._cond:
+                    self.grabbed = False
+                    self._cond.notify_all()
+                break
+            if img is not self.buffers[index]:
+                self.buffers[index] = img   # resolution changed: keep the new array
+            self._publish(index)
+
+    @property
+    def finished(self):
+        """True once the source has ended or stop() was called; until then a failed read is a stall."""
+        return not self.grabbed or self.stopped
+
+    def read_frame(self, timeout=1.0):
+        """
+        Waits for a new frame; returns (grabbed, frame, frame_id, timestamp).
+        The frame stays valid (and may be drawn on) until the next call.
+        grabbed is False both on a timeout and at the end; check `finished`.
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self.frame_id > self._last_read or not self.grabbed or self.stopped,
+                    timeout):
+                return False, None, self._last_read, None
+            if self.frame_id <= self._last_read:
+                return False, None, self._last_read, None
+            self._held = self._latest
+            self._last_read = self.frame_id
+            self._cond.notify_all()
+            return True, self.buffers[self._held], self.frame_id, self.timestamp
 
     def read(self):
-        return self.grabbed, self.frame
+        grabbed, frame, _, _ = self.read_frame()
+        return grabbed, frame
 
     def stop(self):
         self.stopped = True
+        with self._cond:
+            self._cond.notify_all()
         self.cap.release()
 
 
-def detect_candidates(gray):
-    # Preprocess: bilateral filter preserves edges
-    blur = cv2.bilateralFilter(gray, 10, 75, 75)
+def detect_candidates(gray, scale=DETECT_SCALE):
+    full_shape = gray.shape
+    if scale < 1.0:
+        # Pyramid level: a 3x3 median keeps module edges at a fraction of the bilateral cost
+        gray = downscale(gray, scale)
+        blur = cv2.medianBlur(gray, 3)
+    else:
+        # Preprocess: bilateral filter preserves edges
+        blur = cv2.bilateralFilter(gray, 10, 75, 75)
     # Adaptive threshold for varying illumination
     thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                   cv2.THRESH_BINARY_INV, 11, 2)
+                                   cv2.THRESH_BINARY_INV, odd(11 * min(1.0, scale)), 2)
     # Morphological close to fill small gaps
     kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
-    # Find contours
-    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    candidates = []
-    h, w = gray.shape
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < 100 or area > w*h*0.2:
-            continue
-        approx = cv2.approxPolyDP(cnt, 0.02 * cv2.arcLength(cnt, True), True)
-        if len(approx) == 4 and cv2.isContourConvex(approx):
-            # Bounding rect
-            x, y, cw, ch = cv2.boundingRect(approx)
-            aspect = cw/ch
-            if 0.8 < aspect < 1.2:
-                candidates.append((x, y, cw, ch))
-    return candidates
+    closed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel,
+                              iterations=max(1, int(round(2 * min(1.0, scale)))))
+    # Convex, square-ish quads (aspect 0.8-1.2), ranked best-first
+    min_area = 100 * min(1.0, scale) ** 2
+    boxes, _ = propose_regions(closed, min_area=min_area, max_area_frac=0.2,
+                               aspect_range=(0.8, 1.2), convex=True)
+    candidates = [tuple(int(v) for v in b) for b in boxes]
+    return map_boxes(candidates, scale, full_shape)
+
+
+def decode_roi(roi):
+    # Upscale small ROIs for better decoding
+    h, w = roi.shape[:2]
+    scale = max(1, int(200 / max(w, h)))
+    if scale > 1:
+        roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    return decoder.decode(roi)
 
 
 def main():
+    install_signal_handlers()
+    sink = open_result_sink()
     vs = VideoStream(src=1, width=640, height=480)
-    print("Starting optimized PCB DataMatrix scanner. Press 'q' to quit.")
+    print("Starting optimized PCB DataMatrix scanner. Press 'q' to quit." if not HEADLESS else
+          "Starting optimized PCB DataMatrix scanner (headless). Stop with Ctrl+C / SIGTERM.")
+    tracker = RoiTracker()
+    processed = 0
+    latency_total = 0.0
+    exporter = start_exporter()
 
     try:
-        while True:
-            ret, frame = vs.read()
+        while not stop_event.is_set():
+            with metrics.stage('wait_frame'):
+                ret, frame, frame_id, captured_at = vs.read_frame()
             if not ret:
-                break
+                if vs.finished:
+                    break
+                continue    # no frame within the timeout: the camera stalled, keep waiting
+
+            with metrics.stage('frame'):
+                with metrics.stage('cvtColor'):
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                # Detect potential DataMatrix regions (periodically or on motion)
+                if tracker.should_detect(gray):
+                    with metrics.stage('detect'):
+                        tracker.update(detect_candidates(gray))
+                # Only decode tracks without a confident result yet
+                new_codes = []
+                for track in tracker.to_decode():
+                    x, y, cw, ch = track.box
+                    roi = gray[y:y+ch, x:x+cw]
+                    with metrics.stage('decode'):
+                        decoded = crop_cache.get_or_decode(roi, decode_roi)
+                    if track.report([result['text'] for result in decoded]):
+                        print(f"Decoded DataMatrix: {track.text}")
+                        new_codes.append(box_record(track.text, track.box, 'DATAMATRIX'))
+                emit(sink, f"dmtx_scanner#{frame_id}", new_codes)
+
+                # Capture-to-result latency for this frame
+                latency = time.perf_counter() - captured_at
+                processed += 1
+                latency_total += latency
+                metrics.record('capture_to_result', int(latency * 1e9))
+                if HEADLESS:
+                    continue
+
+                # Draw cached results on original frame
+                with metrics.stage('draw'):
+                    for track in tracker.decoded():
+                        x, y, cw, ch = track.box
+                        cv2.rectangle(frame, (x, y), (x+cw, y+ch), (0, 255, 0), 2)
+                        cv2.putText(frame, track.text, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX,
+                                    0.6, (0, 255, 0), 2)
+                    draw_overlay(frame, stages=('detect', 'decode', 'draw', 'imshow'))
 
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            # Detect potential DataMatrix regions
-            rois = detect_candidates(gray)
-            for (x, y, cw, ch) in rois:
-                roi = gray[y:y+ch, x:x+cw]
-                # Upscale small ROIs for better decoding
-                scale = max(1, int(200 / max(cw, ch)))
-                if scale > 1:
-                    roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
-
-                decoded = pylibdmtx.decode(roi)
-                for result in decoded:
-                    data = result.data.decode('utf-8')
-                    # Draw on original frame
-                    cv2.rectangle(frame, (x, y), (x+cw, y+ch), (0, 255, 0), 2)
-                    cv2.putText(frame, data, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6, (0, 255, 0), 2)
-                    print(f"Decoded DataMatrix: {data}")
-
-            cv2.imshow('PCB DataMatrix Scanner', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+                with metrics.stage('imshow'):
+                    cv2.imshow('PCB DataMatrix Scanner', frame)
+                    key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
                 break
 
     finally:
         vs.stop()
-        cv2.destroyAllWindows()
+        if sink:
+            sink.close()
+        if processed:
+            print(f"Frames captured: {vs.captured}, processed: {processed}, dropped: {vs.dropped}, "
+                  f"mean capture-to-result: {1000 * latency_total / processed:.1f} ms")
+        if not HEADLESS:
+            cv2.destroyAllWindows()
+        print("Decoder stats:", decoder.report())
+        print("Crop cache:", crop_cache.stats())
+        if exporter:
+            exporter.stop()
+        report_metrics()
 
 if __name__ == '__main__':
     main()
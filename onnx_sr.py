@@ -0,0 +1,163 @@
+# Optional ONNX super-resolution backend
+# --------------------------------------
+# Loads a small x2/x4 SR model (e.g. an ESPCN / Real-ESRGAN-compact export) with
+# onnxruntime on the CPU, once per process, and upscales all ROIs of a frame in a
+# single batched inference call. When onnxruntime or the model file is missing,
+# or the model fails at inference (fixed input shape, other I/O contract), the
+# resolver disables itself and callers fall back to cv2 cubic resize.
+#
+# Crops of very different shapes are not padded to one canvas: they are sorted
+# by padded shape and split into groups whose canvas wastes at most
+# MAX_PAD_WASTE of its pixels on padding, one inference call per group.
+#
+# Model contract: input NCHW float32 RGB in [0, 1] with dynamic batch/height/width,
+# output NCHW RGB upscaled by an integer factor.
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+SR_MODEL_PATH = os.environ.get(
+    'SR_MODEL_PATH', os.path.join(os.path.dirname(__file__), 'models', 'sr_x2.onnx'))
+SR_THREADS = int(os.environ.get('SR_THREADS', '2'))   # onnxruntime intra-op threads
+PAD_MULTIPLE = 8            # Batch canvas is padded to a multiple of this
+MAX_PAD_WASTE = 0.25        # Largest share of a batch canvas allowed to be padding
+
+
+class OnnxSuperResolver:
+    def __init__(self, model_path=SR_MODEL_PATH, threads=SR_THREADS):
+        self.model_path = model_path
+        self.threads = threads
+        self._session = None
+        self._input_name = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._session is not None or self._failed:
+                return self._session
+            if not os.path.exists(self.model_path):
+                self._failed = True
+                return None
+            try:
+                import onnxruntime as ort
+                opts = ort.SessionOptions()
+                opts.intra_op_num_threads = self.threads
+                opts.inter_op_num_threads = 1
+                self._session = ort.InferenceSession(
+                    self.model_path, opts, providers=['CPUExecutionProvider'])
+                self._input_name = self._session.get_inputs()[0].name
+                print("Loaded SR model:", self.model_path)
+            except Exception as e:
+                print("SR model unavailable, using cubic resize:", e)
+                self._failed = True
+            return self._session
+
+    @property
+    def available(self) -> bool:
+        return self._load() is not None
+
+    def _disable(self, error):
+        """Drops the session after an inference error; later calls return None."""
+        with self._lock:
+            if self._session is not None:
+                print("SR inference failed, using cubic resize:", error)
+            self._session = None
+            self._failed = True
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch})[0]
+
+    def upscale_batch(self, crops: list) -> list:
+        """
+        Upscales BGR or gray uint8 crops, batching crops of similar shape (see
+        shape_groups) into one inference call each. Returns the upscaled crops
+        in input order, or None if no model is loaded or inference fails.
+        """
+        if not crops or self._load() is None:
+            return None
+        results = [None] * len(crops)
+        try:
+            for group in shape_groups([c.shape[:2] for c in crops]):
+                for i, img in zip(group, self._upscale_group([crops[i] for i in group])):
+                    results[i] = img
+        except Exception as e:
+            self._disable(e)
+            return None
+        return results
+
+    def _upscale_group(self, crops: list) -> list:
+        """
+        One inference call: crops are zero-padded onto a shared canvas and each
+        output is cut back to its own (h * scale, w * scale) region.
+        """
+        max_h = max(c.shape[0] for c in crops)
+        max_w = max(c.shape[1] for c in crops)
+        max_h += -max_h % PAD_MULTIPLE
+        max_w += -max_w % PAD_MULTIPLE
+
+        batch = np.zeros((len(crops), 3, max_h, max_w), np.float32)
+        for i, crop in enumerate(crops):
+            rgb = cv2.cvtColor(crop, cv2.COLOR_GRAY2RGB if crop.ndim == 2 else cv2.COLOR_BGR2RGB)
+            h, w = rgb.shape[:2]
+            batch[i, :, :h, :w] = rgb.transpose(2, 0, 1)
+        batch *= 1.0 / 255.0
+
+        try:
+            out = self._run(batch)
+        except Exception:
+            # Model without a dynamic batch axis: one crop at a time
+            out = np.concatenate([self._run(batch[i:i + 1]) for i in range(len(crops))])
+
+        scale = out.shape[2] // max_h
+        results = []
+        for i, crop in enumerate(crops):
+            h, w = crop.shape[:2]
+            img = out[i, :, :h * scale, :w * scale].transpose(1, 2, 0)
+            img = np.clip(img * 255.0 + 0.5, 0, 255).astype(np.uint8)
+            code = cv2.COLOR_RGB2GRAY if crop.ndim == 2 else cv2.COLOR_RGB2BGR
+            results.append(cv2.cvtColor(img, code))
+        return results
+
+
+def _padded(shape):
+    h, w = shape
+    return h + -h % PAD_MULTIPLE, w + -w % PAD_MULTIPLE
+
+
+def shape_groups(shapes, max_waste=MAX_PAD_WASTE):
+    """
+    Splits crop indices into batches: sorted by padded (h, w), a batch grows
+    while padding stays within `max_waste` of its max_h x max_w canvas.
+    """
+    order = sorted(range(len(shapes)), key=lambda i: _padded(shapes[i]))
+    groups, group, area, max_h, max_w = [], [], 0, 0, 0
+    for i in order:
+        h, w = _padded(shapes[i])
+        new_h, new_w = max(max_h, h), max(max_w, w)
+        canvas = (len(group) + 1) * new_h * new_w
+        if group and area + h * w < (1.0 - max_waste) * canvas:
+            groups.append(group)
+            group, area, new_h, new_w = [], 0, h, w
+        group.append(i)
+        area += h * w
+        max_h, max_w = new_h, new_w
+    if group:
+        groups.append(group)
+    return groups
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> OnnxSuperResolver:
+    """Process-wide resolver; the model itself is only loaded on first use."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = OnnxSuperResolver()
+        return _resolver
@@ -0,0 +1,294 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from board_segment import FAST_SEGMENT, SEGMENT_MIN_CONFIDENCE, histogram_threshold, segment_board
+from rembg_session import remove_background_array
+
+# In-memory preprocessing pipeline
+# --------------------------------
+# The image_preprocess / grayscale flows as a chain of named stages that pass
+# arrays along instead of writing and re-reading `_bg_removed.png`:
+#
+#   process (image_preprocess): segment -> value -> invert
+#   invert  (grayscale):        segment -> board_threshold -> invert
+#   bg:                         segment
+#
+# "segment" tries board_segment's hue-based mask first and only runs rembg when
+# its confidence is below SEGMENT_MIN_CONFIDENCE; Pipeline.last_info tells which
+# path each image took and Pipeline.stats() how often the fast path won.
+# "value" is max(B, G, R): exactly what the old BGR->HSV, S=0, HSV->BGR, BGR->GRAY
+# sequence produced (HSV with zero saturation converts back to (V, V, V)), in one
+# pass instead of three full-frame conversions. "board_threshold" binarises at
+# the Otsu level of the board pixels' gray histogram instead of a fixed 60.
+# Per-pixel uint8 stages given as lookup tables (invert) are fused into the
+# stage before them when it is a table too: "board_threshold, invert" becomes
+# one cv2.LUT pass with a per-image table (level -> 200, inverted) instead of a
+# threshold and a full-frame inversion. Every stage keeps its output buffer and
+# reuses it for the next image of the same size, so a pipeline's output is only
+# valid until its next run().
+#
+# With debug_dir set, stages are not fused and each intermediate is written as
+# <debug_dir>/<name>_<index>_<stage>.png.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def _buffer(dst, shape, dtype=np.uint8):
+    """Reuse `dst` when it has the wanted shape, else allocate."""
+    if dst is not None and dst.shape == shape and dst.dtype == dtype:
+        return dst
+    return np.empty(shape, dtype)
+
+
+#---------------------------------------STAGES-------------------------------------------------------------#
+class Stage:
+    """
+    A named step: fn(src, dst) -> output, where `dst` is this stage's buffer from
+    the last run. Stages may set `info` (per image) and `counts` (totals).
+    """
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.buffer = None
+        self.info = None
+        self.counts = None
+
+    def run(self, src):
+        self.buffer = self.fn(src, self.buffer)
+        return self.buffer
+
+
+class PointStage(Stage):
+    """Per-pixel uint8 -> uint8 mapping given as a 256-entry lookup table; adjacent ones fuse."""
+
+    def __init__(self, name, lut):
+        self.lut = np.asarray(lut, np.uint8)
+        super().__init__(name, lambda src, dst: cv2.LUT(src, self.lut, dst=_buffer(dst, src.shape)))
+
+    def then(self, other):
+        return PointStage(f"{self.name}+{other.name}", other.lut[self.lut])
+
+
+def _decode(src):
+    return src if isinstance(src, np.ndarray) else cv2.imdecode(np.frombuffer(src, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _remove_background(src, session):
+    if callable(session):
+        session = session()         # Deferred: model loads on the first image that needs it
+    data = src if isinstance(src, (bytes, bytearray)) else cv2.imencode('.png', src)[1].tobytes()
+    rgba = remove_background_array(data, session)
+    if rgba is None:
+        raise ValueError("background removal failed")
+    return rgba
+
+
+def segment_stage(session=None, min_confidence=SEGMENT_MIN_CONFIDENCE, fast=FAST_SEGMENT):
+    """
+    Encoded image bytes (or a BGR array) -> BGRA with the background made
+    transparent. Takes board_segment's mask when it is confident enough; rembg
+    handles the rest. `session` is a rembg session, a callable returning one,
+    or None for rembg_session.get_session() (loaded only on first fallback).
+    """
+    def run(src, dst):
+        start = time.perf_counter()
+        if fast:
+            img = _decode(src)
+            if img is None:
+                raise ValueError("could not decode image")
+            mask, confidence, info = segment_board(img)
+            if mask is not None and confidence >= min_confidence:
+                out = cv2.cvtColor(cv2.bitwise_and(img, img, mask=mask), cv2.COLOR_BGR2BGRA,
+                                   dst=_buffer(dst, img.shape[:2] + (4,)))
+                out[:, :, 3] = mask
+                stage.counts['fast'] += 1
+                stage.info = dict(info, path='fast', ms=round((time.perf_counter() - start) * 1000.0, 1))
+                return out
+        else:
+            info = {}
+        rgba = _remove_background(src, session)
+        stage.counts['rembg'] += 1
+        stage.info = dict(info, path='rembg', ms=round((time.perf_counter() - start) * 1000.0, 1))
+        return rgba
+
+    stage = Stage('segment', run)
+    stage.counts = {'fast': 0, 'rembg': 0}
+    return stage
+
+
+def channel_max(src, dst=None):
+    """max(B, G, R) per pixel (the HSV value channel); alpha is ignored."""
+    dst = _buffer(dst, src.shape[:2])
+    np.maximum(src[:, :, 0], src[:, :, 1], out=dst)
+    np.maximum(dst, src[:, :, 2], out=dst)
+    return dst
+
+
+def value_stage():
+    return Stage('value', channel_max)
+
+
+class LevelStage(Stage):
+    """
+    Per-pixel mapping whose table depends on the image: fn(src) -> (gray,
+    256-entry table, info). PointStages after it fold into the table (then()),
+    so the pair still runs as one cv2.LUT pass.
+    """
+
+    def __init__(self, name, fn, post=None):
+        self.table_fn = fn
+        self.post = np.arange(256, dtype=np.uint8) if post is None else post
+        super().__init__(name, self._apply)
+
+    def _apply(self, src, dst):
+        gray, table, self.info = self.table_fn(src)
+        return cv2.LUT(gray, self.post[table], dst=_buffer(dst, gray.shape))
+
+    def then(self, other):
+        return LevelStage(f"{self.name}+{other.name}", self.table_fn, other.lut[self.post])
+
+
+def board_threshold_stage(maxval=255):
+    """
+    BGRA/BGR/gray -> binary (> level -> maxval, else 0), with the level taken
+    from the gray histogram of the opaque (board) pixels.
+    """
+    def table(src):
+        if src.ndim == 2:
+            gray, mask = src, None
+        else:
+            code = cv2.COLOR_BGRA2GRAY if src.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            gray = cv2.cvtColor(src, code)
+            mask = src[:, :, 3] if src.shape[2] == 4 else None
+        level = histogram_threshold(gray, mask)
+        return gray, np.where(np.arange(256) > level, maxval, 0).astype(np.uint8), {'level': level}
+
+    return LevelStage('board_threshold', table)
+
+
+def invert_stage():
+    return PointStage('invert', 255 - np.arange(256))
+
+
+#---------------------------------------PIPELINE-----------------------------------------------------------#
+class Pipeline:
+    def __init__(self, stages, debug_dir=None):
+        self.debug_dir = debug_dir
+        self.stages = list(stages) if debug_dir else self._fuse(stages)
+        self.timings_ms = {s.name: 0.0 for s in self.stages}
+        self.runs = 0
+        self.last_info = {}
+
+    @staticmethod
+    def _fuse(stages):
+        fused = []
+        for stage in stages:
+            if fused and isinstance(stage, PointStage) and isinstance(fused[-1], (PointStage, LevelStage)):
+                fused[-1] = fused[-1].then(stage)
+            else:
+                fused.append(stage)
+        return fused
+
+    def run(self, data, name='image'):
+        """Runs every stage on `data` (encoded bytes or an array); returns the last output."""
+        out = data
+        for idx, stage in enumerate(self.stages):
+            start = time.perf_counter()
+            out = stage.run(out)
+            self.timings_ms[stage.name] += (time.perf_counter() - start) * 1000.0
+            if self.debug_dir:
+                os.makedirs(self.debug_dir, exist_ok=True)
+                cv2.imwrite(os.path.join(self.debug_dir, f"{name}_{idx:02d}_{stage.name}.png"), out)
+        self.runs += 1
+        self.last_info = {s.name: s.info for s in self.stages if s.info is not None}
+        return out
+
+    def report(self):
+        """Mean milliseconds per stage over all runs."""
+        return {name: round(ms / max(1, self.runs), 2) for name, ms in self.timings_ms.items()}
+
+    def stats(self):
+        """Totals kept by the stages, e.g. {'segment': {'fast': 9, 'rembg': 1}}."""
+        return {s.name: dict(s.counts) for s in self.stages if s.counts is not None}
+
+
+# preset -> (stage factory, output suffix, default output folder); names match batch_preprocess modes
+PRESETS = {
+    'bg': (lambda session: [segment_stage(session)],
+           '_bg_removed.png', 'sample_images_bg_removed'),
+    'process': (lambda session: [segment_stage(session), value_stage(), invert_stage()],
+                '_bw_inverted.jpg', 'sample_images_processed'),
+    'invert': (lambda session: [segment_stage(session), board_threshold_stage(200), invert_stage()],
+               '_inverted.jpg', 'sample_images_inverted'),
+}
+
+
+def build_pipeline(preset, debug_dir=None, session=None):
+    return Pipeline(PRESETS[preset][0](session), debug_dir)
+
+
+def output_path(path, preset, out_dir=None):
+    _, suffix, default_dir = PRESETS[preset]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir or default_dir, name + suffix)
+
+
+def collect_images(sources):
+    paths = []
+    for src in sources:
+        if os.path.isdir(src):
+            paths.extend(os.path.join(src, n) for n in sorted(os.listdir(src))
+                         if n.lower().endswith(IMAGE_EXTENSIONS) and '_bg_removed' not in n)
+        else:
+            paths.append(src)
+    return paths
+
+
+def process_folder(preset, sources, out_dir=None, debug_dir=None):
+    """Runs a preset over files / folders in this process, reusing the stage buffers."""
+    pipeline = build_pipeline(preset, debug_dir)
+    os.makedirs(out_dir or PRESETS[preset][2], exist_ok=True)
+    done = failed = 0
+    for path in collect_images(sources):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            name = os.path.splitext(os.path.basename(path))[0]
+            out = pipeline.run(data, name)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {path}: {e}")
+            failed += 1
+            continue
+        out_path = output_path(path, preset, out_dir)
+        if cv2.imwrite(out_path, out):
+            print(f"Saved {preset} image to: {out_path}  {pipeline.last_info}")
+            done += 1
+        else:
+            print(f"ERROR: Could not save {out_path}")
+            failed += 1
+    return {'images': done + failed, 'ok': done, 'failed': failed,
+            'stage_ms': pipeline.report(), **pipeline.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='In-memory preprocessing presets for files or folders.')
+    parser.add_argument('sources', nargs='+', help='Image files or directories')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='process')
+    parser.add_argument('--out', help='Output directory (default depends on --preset)')
+    parser.add_argument('--debug-dir', help='Write every intermediate stage here')
+    args = parser.parse_args()
+
+    stats = process_folder(args.preset, args.sources, args.out, args.debug_dir)
+    print("Done:", stats)
+    if not stats['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Region proposal helpers
+# -----------------------
+# Shared by barcode_classifier.detect_code_regions and
+# matrix_decoder_orig.detect_candidates: candidate detection can run on a
+# downscaled copy of the frame (pyramid level) and the boxes are mapped back to
+# full resolution for decoding.
+#
+# propose_regions() ranks candidates; it does not make detection faster. It is
+# the quadrilateral test of the original per-contour loops (same boxes), plus
+# optional aspect / rectangularity / edge-density filters on the accepted
+# quads and a score so decoding starts with the best ones. Only the contours
+# and the accepted boxes are touched: no full-frame passes beyond findContours.
+#
+# The per-contour loop stays on purpose. Culling contours as array operations
+# before approxPolyDP was measured at 1080p and never paid for itself:
+# connectedComponentsWithStats alone takes 11-16 ms, more than the whole loop;
+# NumPy bounding boxes / areas of all contours cost about as much as the
+# per-contour calls they save (3149 contours: 2.4 ms vs 2.1 ms of contourArea),
+# and culls tight enough to matter drop real quads. The speed knob is
+# DETECT_SCALE (see bench_detection.py for its recall cost).
+
+import os
+
+import cv2
+import numpy as np
+
+# Detection scale per station: 1.0 = full resolution, 0.5 = half, 0.25 = quarter.
+DETECT_SCALE = float(os.environ.get('DETECT_SCALE', '1.0'))
+APPROX_EPSILON = 0.02       # approxPolyDP tolerance as a fraction of the contour perimeter
+EDGE_SAMPLE_STEP = 4        # Edge density (ranking only) from every 4th row of a box
+
+
+def downscale(gray: np.ndarray, scale: float) -> np.ndarray:
+    """Area-averaged downscale (pyramid level) of a gray frame."""
+    if scale >= 1.0:
+        return gray
+    h, w = gray.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def odd(n: float, minimum: int = 3) -> int:
+    """Nearest odd kernel/block size >= minimum."""
+    n = max(minimum, int(round(n)))
+    return n if n % 2 else n + 1
+
+
+def map_boxes(boxes: list, scale: float, shape: tuple) -> list:
+    """
+    Maps (x, y, w, h) boxes found at `scale` back to full resolution.
+    Boxes grow by one source pixel on every side to cover rounding, and are
+    clipped to the full-resolution frame `shape`.
+    """
+    if scale >= 1.0 or not boxes:
+        return list(boxes)
+    full_h, full_w = shape[:2]
+    inv = 1.0 / scale
+    mapped = []
+    for x, y, w, h in boxes:
+        x0 = max(0, int((x - 1) * inv))
+        y0 = max(0, int((y - 1) * inv))
+        x1 = min(full_w, int(np.ceil((x + w + 1) * inv)))
+        y1 = min(full_h, int(np.ceil((y + h + 1) * inv)))
+        mapped.append((x0, y0, x1 - x0, y1 - y0))
+    return mapped
+
+
+def edge_density(binary: np.ndarray, x, y, w, h, step=EDGE_SAMPLE_STEP) -> float:
+    """Share of black/white transitions along every `step`-th row of the box."""
+    rows = binary[y:y + h:step, x:x + w]
+    if rows.shape[1] < 2:
+        return 0.0
+    return np.count_nonzero(rows[:, 1:] != rows[:, :-1]) / float(rows.size)
+
+
+def propose_regions(binary: np.ndarray, min_area=100, max_area_frac=0.2,
+                    aspect_range=(0.0, np.inf), min_fill=0.0, min_edge_density=0.0,
+                    convex=False, epsilon=APPROX_EPSILON):
+    """
+    Ranked quadrilateral candidate regions from a binary mask.
+
+    Each external contour is approximated (approxPolyDP, epsilon x perimeter);
+    it must give 4 vertices (and a convex polygon with convex=True) enclosing
+    more than min_area and at most max_area_frac of the mask. The quad's
+    bounding box is then filtered on aspect, rectangularity (quad area / box
+    area, >= min_fill) and edge density.
+
+    Returns (boxes, scores): an (N, 4) int array of (x, y, w, h) and N scores,
+    best first. The score favours rectangular, dense, square-ish regions.
+    """
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    max_area = max_area_frac * binary.size
+    boxes, scores = [], []
+    for c in contours:
+        approx = cv2.approxPolyDP(c, epsilon * cv2.arcLength(c, True), True)
+        if len(approx) != 4 or (convex and not cv2.isContourConvex(approx)):
+            continue
+        quad_area = cv2.contourArea(approx)
+        if not min_area < quad_area <= max_area:
+            continue
+        x, y, bw, bh = cv2.boundingRect(approx)
+        aspect = bw / max(bh, 1)
+        if not aspect_range[0] < aspect < aspect_range[1]:
+            continue
+        fill = quad_area / max(1, bw * bh)
+        if fill < min_fill:
+            continue
+        density = edge_density(binary, x, y, bw, bh)
+        if density < min_edge_density:
+            continue
+        boxes.append((x, y, bw, bh))
+        scores.append(fill * np.sqrt(density) * min(aspect, 1.0 / max(aspect, 1e-6)))
+    if not boxes:
+        return np.zeros((0, 4), np.int32), np.zeros(0, np.float32)
+
+    boxes, scores = np.array(boxes, np.int32), np.array(scores, np.float32)
+    order = np.argsort(-scores, kind='stable')
+    return boxes[order], scores[order]
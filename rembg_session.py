@@ -0,0 +1,67 @@
+# Shared rembg session
+# --------------------
+# rembg.remove() without a session loads the U^2-Net ONNX model again on every
+# call (seconds per image). get_session() creates one session per process and
+# model on first use; image_preprocess, grayscale and batch_preprocess share it.
+# remove_background_array() / remove_background() are the rembg helpers of the
+# single-image scripts and preprocess_pipeline's segment stage.
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+REMBG_MODEL = os.environ.get('REMBG_MODEL', 'u2net')
+REMBG_THREADS = int(os.environ.get('REMBG_THREADS', '0'))   # onnxruntime intra-op threads, 0 = default
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def get_session(model=REMBG_MODEL, threads=REMBG_THREADS):
+    """Process-wide rembg session for `model`, created on first use."""
+    with _lock:
+        session = _sessions.get(model)
+        if session is None:
+            if threads:
+                # rembg's new_session sizes the onnxruntime thread pools from OMP_NUM_THREADS
+                os.environ['OMP_NUM_THREADS'] = str(threads)
+            from rembg import new_session
+            session = _sessions[model] = new_session(model)
+            print(f"Loaded rembg model: {model}")
+        return session
+
+
+def remove_background_array(input_bytes, session=None):
+    """Runs rembg on encoded image bytes and returns the BGRA result, or None."""
+    from rembg import remove
+    output_bytes = remove(input_bytes, session=session or get_session())
+    rgba = cv2.imdecode(np.frombuffer(output_bytes, np.uint8), cv2.IMREAD_UNCHANGED)
+    if rgba is None or rgba.ndim != 3 or rgba.shape[2] != 4:
+        return None
+    return rgba
+
+
+def remove_background(input_image_path):
+    """Writes <name>_bg_removed.png next to the input; returns its path or None."""
+    try:
+        with open(input_image_path, 'rb') as f:
+            input_bytes = f.read()
+    except FileNotFoundError:
+        print(f"ERROR: File not found: {input_image_path}")
+        return None
+
+    rgba = remove_background_array(input_bytes)
+    if rgba is None:
+        print("ERROR: Failed to process image.")
+        return None
+
+    base_dir = os.path.dirname(input_image_path)
+    name, _ = os.path.splitext(os.path.basename(input_image_path))
+    out_path = os.path.join(base_dir, name + "_bg_removed.png")
+    if cv2.imwrite(out_path, rgba):
+        print(f"Saved background-removed image to: {out_path}")
+        return out_path
+    print("ERROR: Could not save the output image.")
+    return None
@@ -0,0 +1,395 @@
+import json
+import os
+import queue
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from barcode_result import ResultBatch
+
+# Result sinks receive decoded barcodes for one image at a time:
+#   sink.begin(image_path)  ->  sink.add(record) per barcode  ->  sink.end()
+# A record is the dict produced by image_barcode.decode_barcodes
+# ({'text', 'format', 'confidence', 'localization'}) or a
+# barcode_result.BarcodeResult, which reads the same way.
+# Live scanners use the frame label (e.g. "camera#1234") as the image path.
+
+
+def atomic_write(path, data):
+    """Write bytes to `path` via a temp file in the same directory plus rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _BackgroundWriter:
+    """Single daemon thread that runs queued write jobs in order."""
+
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            try:
+                job()
+            except Exception as e:
+                print("Result sink write failed:", e)
+
+    def submit(self, job):
+        self._jobs.put(job)
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+
+class ResultSink:
+    """Base sink: keeps the records of the current image in memory and does no I/O."""
+
+    def __init__(self, background=False):
+        self._writer = _BackgroundWriter() if background else None
+        self.image_path = None
+        self.records = []
+
+    def _run(self, job):
+        if self._writer:
+            self._writer.submit(job)
+        else:
+            job()
+
+    def begin(self, image_path, timestamp=None):
+        self.image_path = image_path
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+
+    def end(self):
+        return self.records
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+
+class MemorySink(ResultSink):
+    """Return-only sink; decode_barcodes still returns the list of records."""
+
+
+class XmlSink(ResultSink):
+    """Writes `<image>_results.xml` once per image, after the last barcode."""
+
+    def __init__(self, out_dir=None, background=False):
+        super().__init__(background)
+        self.out_dir = out_dir
+
+    def xml_path(self, image_path):
+        base = os.path.splitext(image_path)[0]
+        if self.out_dir:
+            base = os.path.join(self.out_dir, os.path.basename(base))
+        return base + '_results.xml'
+
+    def end(self):
+        records = self.records
+        if not records:
+            return records
+        image_path, timestamp = self.image_path, self.timestamp
+        xml_path = self.xml_path(image_path)
+
+        def write():
+            root = build_xml(image_path, timestamp, records)
+            atomic_write(xml_path, ET.tostring(root, encoding='utf-8', xml_declaration=True))
+            print(f"Results saved to XML: {xml_path}")
+
+        self._run(write)
+        return records
+
+
+class JsonlSink(ResultSink):
+    """Appends one JSON line per barcode to a single buffered file."""
+
+    def __init__(self, path, background=False):
+        super().__init__(background)
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+
+    def add(self, record):
+        super().add(record)
+        line = json.dumps({'image': self.image_path, 'timestamp': self.timestamp, **record}) + '\n'
+        self._run(lambda: self._file.write(line))
+
+    def end(self):
+        self._run(self._file.flush)
+        return self.records
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+def _json_line(image_path, timestamp, record):
+    return json.dumps({'image': image_path, 'timestamp': timestamp, **record}) + '\n'
+
+
+class StdoutSink(ResultSink):
+    """One JSON line per barcode on stdout (or `stream`), flushed per image."""
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream or sys.stdout
+
+    def add(self, record):
+        super().add(record)
+        self.stream.write(_json_line(self.image_path, self.timestamp, record))
+
+    def end(self):
+        self.stream.flush()
+        return self.records
+
+
+class RotatingFileSink(ResultSink):
+    """
+    JSON lines like JsonlSink, but the file is rotated to `path.1` ... `path.N`
+    once it grows past `max_bytes`, so unattended stations never fill the disk.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5, background=False):
+        super().__init__(background)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def end(self):
+        lines = ''.join(_json_line(self.image_path, self.timestamp, r) for r in self.records)
+
+        def write():
+            self._file.write(lines)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+        if lines:
+            self._run(write)
+        return self.records
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class SqliteSink(ResultSink):
+    """Inserts the barcodes of each image into a `results` table in one transaction."""
+
+    def __init__(self, path, background=True):
+        super().__init__(background)
+        self.path = path
+        self._conn = None
+        self._run(self._connect)    # the connection lives on the writer thread
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS results (image TEXT, timestamp TEXT, text TEXT, '
+            'format TEXT, confidence REAL, localization TEXT)')
+        self._conn.commit()
+
+    def end(self):
+        rows = [(self.image_path, self.timestamp, r['text'], r['format'], r['confidence'],
+                 json.dumps(r['localization'])) for r in self.records]
+
+        def write():
+            with self._conn:
+                self._conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+        if rows:
+            self._run(write)
+        return self.records
+
+    def close(self):
+        self._run(lambda: self._conn and self._conn.close())
+        super().close()
+
+
+class SocketSink(ResultSink):
+    """
+    Sends JSON lines to a local listener: a Unix socket path, or host:port over TCP.
+    If nobody is listening the lines are dropped and the connection is retried
+    at most every `retry` seconds, so a missing consumer never stalls a scanner.
+    """
+
+    def __init__(self, address, retry=5.0, background=True):
+        super().__init__(background)
+        self.address = address
+        self.retry = retry
+        self.dropped = 0
+        self._sock = None
+        self._next_try = 0.0
+
+    def _connect(self):
+        if ':' in self.address and not os.path.exists(self.address):
+            host, port = self.address.rsplit(':', 1)
+            return socket.create_connection((host, int(port)), timeout=1.0)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(1.0)
+        sock.connect(self.address)
+        return sock
+
+    def _send(self, data):
+        if self._sock is None:
+            now = time.monotonic()
+            if now < self._next_try:
+                self.dropped += 1
+                return
+            try:
+                self._sock = self._connect()
+            except OSError:
+                self._next_try = now + self.retry
+                self.dropped += 1
+                return
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self._sock.close()
+            self._sock = None
+            self.dropped += 1
+
+    def end(self):
+        data = ''.join(_json_line(self.image_path, self.timestamp, r) for r in self.records)
+        if data:
+            self._run(lambda: self._send(data.encode('utf-8')))
+        return self.records
+
+    def close(self):
+        super().close()
+        if self._sock is not None:
+            self._sock.close()
+
+
+class BatchSink(ResultSink):
+    """
+    Collects the records of every image in one columnar ResultBatch and writes
+    it to `path` on close (.arrow / .msgpack / .json, see barcode_result).
+    """
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path
+        self.batch = ResultBatch()
+
+    def end(self):
+        self.batch.extend(self.records, self.image_path)
+        return self.records
+
+    def close(self):
+        super().close()
+        if self.path:
+            self.batch.save(self.path)
+            print(f"Saved {len(self.batch)} results to {self.path}")
+
+
+class MultiSink(ResultSink):
+    """Fans every call out to several sinks."""
+
+    def __init__(self, sinks):
+        super().__init__()
+        self.sinks = list(sinks)
+
+    def begin(self, image_path, timestamp=None):
+        super().begin(image_path, timestamp)
+        for sink in self.sinks:
+            sink.begin(image_path, self.timestamp)
+
+    def add(self, record):
+        super().add(record)
+        for sink in self.sinks:
+            sink.add(record)
+
+    def end(self):
+        for sink in self.sinks:
+            sink.end()
+        return self.records
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def open_sinks(spec):
+    """
+    Builds a sink from a comma-separated spec, e.g. "stdout,sqlite:results.db":
+      stdout | jsonl:PATH | rotating:PATH | sqlite:PATH | socket:PATH_OR_HOST:PORT | xml:DIR
+      | batch:PATH (.arrow / .msgpack / .json, written on close)
+    Returns None for an empty spec.
+    """
+    sinks = []
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        kind, _, arg = item.partition(':')
+        if kind == 'stdout':
+            sinks.append(StdoutSink())
+        elif kind == 'jsonl':
+            sinks.append(JsonlSink(arg))
+        elif kind == 'rotating':
+            sinks.append(RotatingFileSink(arg))
+        elif kind == 'sqlite':
+            sinks.append(SqliteSink(arg))
+        elif kind == 'socket':
+            sinks.append(SocketSink(arg))
+        elif kind == 'xml':
+            sinks.append(XmlSink(arg or None))
+        elif kind == 'batch':
+            sinks.append(BatchSink(arg))
+        else:
+            raise ValueError(f"Unknown result sink: {item}")
+    if not sinks:
+        return None
+    return sinks[0] if len(sinks) == 1 else MultiSink(sinks)
+
+
+def build_xml(image_path, timestamp, records):
+    """Build the <Barcodes> tree the GUI reads back from `_results.xml`."""
+    root = ET.Element('Barcodes')
+    root.set('image', os.path.basename(image_path))
+    root.set('timestamp', timestamp)
+    for idx, rec in enumerate(records, start=1):
+        bc_elem = ET.SubElement(root, 'Barcode', id=str(idx))
+        ET.SubElement(bc_elem, 'Text').text = rec['text']
+        ET.SubElement(bc_elem, 'Format').text = rec['format']
+        ET.SubElement(bc_elem, 'Confidence').text = str(rec['confidence'])
+        loc_elem = ET.SubElement(bc_elem, 'Localization')
+        for i, (x, y) in enumerate(rec['localization']):
+            pt_elem = ET.SubElement(loc_elem, 'Point', index=str(i))
+            ET.SubElement(pt_elem, 'X').text = str(x)
+            ET.SubElement(pt_elem, 'Y').text = str(y)
+    return root
@@ -0,0 +1,122 @@
+# ROI tracker
+# -----------
+# Keeps stable IDs for candidate code regions across frames (greedy IoU
+# association), so a board sitting still under the camera is detected only every
+# few frames and each label is decoded until it has a confident result, then
+# reused from the track instead of being decoded again.
+
+import cv2
+import numpy as np
+
+IOU_THRESHOLD = 0.3         # Minimum overlap to treat two boxes as the same ROI
+MAX_MISSES = 5              # Detection passes a track may go unseen before it is dropped
+CONFIRM_HITS = 2            # Identical decodes needed before a track stops re-decoding
+DETECT_EVERY = 10           # Run region detection at least every N frames
+MOTION_THRESHOLD = 6.0      # Mean abs change (0-255) of a thumbnail that forces detection
+MOTION_SIZE = (64, 36)      # Thumbnail size used for the motion check
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU between every (x, y, w, h) box in `a` and every box in `b`."""
+    a = a.astype(np.float32)[:, None, :]
+    b = b.astype(np.float32)[None, :, :]
+    x1 = np.maximum(a[..., 0], b[..., 0])
+    y1 = np.maximum(a[..., 1], b[..., 1])
+    x2 = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    y2 = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class Track:
+    """One ROI followed across frames, with its cached decode result."""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.text = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def confident(self):
+        return self.text is not None and self.hits >= CONFIRM_HITS
+
+    def report(self, texts):
+        """Record a decode attempt; returns True when the track's text changed."""
+        if not texts:
+            return False
+        if texts[0] == self.text:
+            self.hits += 1
+            return False
+        self.text = texts[0]
+        self.hits = 1
+        return True
+
+
+class RoiTracker:
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_misses=MAX_MISSES,
+                 detect_every=DETECT_EVERY, motion_threshold=MOTION_THRESHOLD):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.detect_every = detect_every
+        self.motion_threshold = motion_threshold
+        self.tracks = []
+        self._next_id = 0
+        self._frames_since_detect = None
+        self._thumb = None
+        self.detections = 0
+        self.frames = 0
+
+    def should_detect(self, gray: np.ndarray) -> bool:
+        """True when region detection should run on this frame (periodic or on motion)."""
+        self.frames += 1
+        thumb = cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+        moved = (self._thumb is None or
+                 cv2.norm(thumb, self._thumb, cv2.NORM_L1) / thumb.size > self.motion_threshold)
+        due = (self._frames_since_detect is None or
+               self._frames_since_detect + 1 >= self.detect_every)
+        if moved or due or not self.tracks:
+            self._thumb = thumb
+            self._frames_since_detect = 0
+            self.detections += 1
+            return True
+        self._frames_since_detect += 1
+        return False
+
+    def update(self, boxes: list) -> list:
+        """Associate freshly detected boxes with existing tracks; returns the live tracks."""
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and boxes:
+            ious = iou_matrix(np.array([t.box for t in self.tracks]), np.array(boxes))
+            # Greedy: best overlaps first
+            for ti, bi in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[ti, bi] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+                track = self.tracks[ti]
+                track.box = tuple(boxes[bi])
+                track.misses = 0
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                self.tracks.append(Track(self._next_id, tuple(box)))
+                self._next_id += 1
+        return self.tracks
+
+    def to_decode(self) -> list:
+        """Tracks that are currently visible and still need a (confident) decode."""
+        return [t for t in self.tracks if t.misses == 0 and not t.confident]
+
+    def decoded(self) -> list:
+        """Tracks with a cached text, for drawing on the overlay."""
+        return [t for t in self.tracks if t.text is not None]
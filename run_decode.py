@@ -1,13 +1,139 @@
+import argparse
+import glob
+import json
+import math
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import image_barcode
+from barcode_result import ResultBatch
+from result_sinks import MemorySink
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+#---------------------------------------BATCH INPUTS-------------------------------------------------------#
+def collect_images(sources, list_file=None):
+    """Expand directories, globs and plain paths (plus an optional file list) into image paths."""
+    paths = []
+    if list_file:
+        with open(list_file, 'r', encoding='utf-8') as f:
+            sources = list(sources) + [line.strip() for line in f if line.strip()]
+
+    for src in sources:
+        if os.path.isdir(src):
+            for name in sorted(os.listdir(src)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(src, name))
+        elif glob.has_magic(src):
+            paths.extend(p for p in sorted(glob.glob(src)) if p.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(src)
+
+    # Keep the first occurrence of each file
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+#---------------------------------------WORKER PROCESS-----------------------------------------------------#
+def _init_worker():
+    # stdout carries the JSON Lines stream, so decoder chatter goes to stderr
+    sys.stdout = sys.stderr
+    image_barcode.get_router_pool(1).warm()
+
+
+def _decode_one(image_path):
+    start = time.perf_counter()
+    # Results only go to the JSON Lines stream: no <image>_results.xml next to the inputs
+    decoded = image_barcode.decode_barcodes(image_path, sink=MemorySink())
+    latency = time.perf_counter() - start
+    return {
+        'image': image_path,
+        'ok': decoded is not None,
+        'latency_ms': round(latency * 1000.0, 2),
+        'results': decoded or [],
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def run_batch(paths, workers=None, out=sys.stdout, batch_out=None):
+    """
+    Decode `paths` on a process pool, streaming one JSON line per image as it completes.
+    With `batch_out`, all results are also kept in one columnar ResultBatch and
+    written there at the end (.arrow / .msgpack / .json).
+    """
+    batch = ResultBatch() if batch_out else None
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {pool.submit(_decode_one, p): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                record = fut.result()
+            except Exception as e:
+                record = {'image': futures[fut], 'ok': False, 'error': str(e), 'results': []}
+            if record['ok']:
+                latencies.append(record['latency_ms'])
+            else:
+                failed += 1
+            line = dict(record, results=[r.to_record() for r in record['results']])
+            out.write(json.dumps(line) + '\n')
+            out.flush()
+            if batch is not None:
+                batch.extend(record['results'], record['image'])
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'images': len(paths),
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'images_per_s': round(len(paths) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+    }
+    if batch is not None:
+        batch.save(batch_out)
+        summary['results'] = len(batch)
+    print("Batch summary:", json.dumps(summary), file=sys.stderr)
+    return summary
+
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: run_decode.py <image_path>")
+    # A lone existing file keeps the old single-image behaviour; directories and globs are batches
+    if len(sys.argv) == 2 and os.path.isfile(sys.argv[1]):
+        image_path = sys.argv[1]
+        decoded = image_barcode.decode_barcodes(image_path)
+        print("Child decoded result:", decoded)
+        return
+
+    parser = argparse.ArgumentParser(
+        description='Decode one image, or a batch of images in parallel (JSON Lines on stdout).',
+        usage='run_decode.py <image_path>\n       run_decode.py [-j N] [--list FILE] [--batch-out FILE] <dir|glob|image> ...'
+    )
+    parser.add_argument('sources', nargs='*', help='Image files, directories or glob patterns')
+    parser.add_argument('--list', dest='list_file', help='Text file with one image path per line')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--batch-out', help='Also write all results as one columnar batch (.arrow/.msgpack/.json)')
+    args = parser.parse_args()
+
+    paths = collect_images(args.sources, args.list_file)
+    if not paths:
+        parser.print_usage()
         sys.exit(1)
-    image_path = sys.argv[1]
-    decoded = image_barcode.decode_barcodes(image_path)
-    print("Child decoded result:", decoded)
+    run_batch(paths, args.workers, batch_out=args.batch_out)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
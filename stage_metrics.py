@@ -0,0 +1,311 @@
+# Hot-path stage metrics
+# ----------------------
+# Per-stage timers for the scanner loops and image_barcode, with rolling
+# HDR-style (log-linear) latency histograms, an optional on-frame overlay and a
+# periodic JSON / Prometheus-text dump.
+#
+#   with metrics.stage('detect'):
+#       boxes = detect_code_regions(gray)
+#
+# Everything is off unless SCAN_METRICS=1; disabled, stage() hands back one shared
+# no-op context manager, so the cost is a method call per stage.
+#
+#   SCAN_METRICS=1        enable the timers
+#   METRICS_OVERLAY=1     draw FPS and per-stage p50/p95 on the preview window
+#   METRICS_FILE=path     dump every METRICS_INTERVAL s (.prom/.txt: Prometheus text, else JSON)
+#   METRICS_PORT=9108     serve /metrics (Prometheus) and /metrics.json on 127.0.0.1
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from result_sinks import atomic_write
+
+METRICS_ENABLED = os.environ.get('SCAN_METRICS', '0') == '1'
+METRICS_OVERLAY = os.environ.get('METRICS_OVERLAY', '0') == '1'
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))     # 0 = no HTTP endpoint
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', '5'))
+METRICS_WINDOW = float(os.environ.get('METRICS_WINDOW', '10'))  # Seconds per rolling window
+SUB_BUCKET_BITS = 3         # 8 buckets per power of two: <= 12.5% relative error
+MAX_SHIFT = 40              # Largest tracked value ~2^43 ns (~2.4 h); larger values are clamped
+
+
+# --- Histogram ---
+_SUB = 1 << SUB_BUCKET_BITS
+NUM_BUCKETS = (MAX_SHIFT + 2) * _SUB
+
+
+def bucket_index(ns: int) -> int:
+    """Log-linear bucket of a non-negative integer: exact below 2*_SUB, then _SUB per octave."""
+    shift = ns.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return ns
+    return min(NUM_BUCKETS - 1, shift * _SUB + (ns >> shift))
+
+
+def bucket_value(idx: int) -> int:
+    """Upper edge of bucket `idx` (what a percentile falling in it reports)."""
+    shift = max(0, idx // _SUB - 1)
+    return ((idx - shift * _SUB + 1) << shift) - 1
+
+
+class RollingHistogram:
+    """
+    Latency histogram over the last one to two windows: counts go to the current
+    window, which replaces the previous one every `window` seconds.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window_ns = int(window * 1e9)
+        self._lock = threading.Lock()
+        self._current = [0] * NUM_BUCKETS
+        self._previous = [0] * NUM_BUCKETS
+        self._started = time.perf_counter_ns()
+        self._previous_started = self._started
+        self.total_count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def _rotate(self, now):
+        if now - self._started >= 2 * self.window_ns:
+            # Idle for more than a whole window: nothing recent to keep
+            self._previous = [0] * NUM_BUCKETS
+            self._previous_started = now
+        else:
+            self._previous = self._current
+            self._previous_started = self._started
+        self._current = [0] * NUM_BUCKETS
+        self._started = now
+
+    def record(self, elapsed_ns, now=None):
+        now = now or time.perf_counter_ns()
+        idx = bucket_index(elapsed_ns)
+        with self._lock:
+            if now - self._started >= self.window_ns:
+                self._rotate(now)
+            self._current[idx] += 1
+            self.total_count += 1
+            self.total_ns += elapsed_ns
+            if elapsed_ns > self.max_ns:
+                self.max_ns = elapsed_ns
+
+    def snapshot(self, percentiles=(50, 95, 99)):
+        now = time.perf_counter_ns()
+        with self._lock:
+            if now - self._started >= self.window_ns:
+                self._rotate(now)
+            counts = [a + b for a, b in zip(self._current, self._previous)]
+            span_ns = max(1, now - self._previous_started)
+            total_count, total_ns, max_ns = self.total_count, self.total_ns, self.max_ns
+        n = sum(counts)
+        out = {
+            'count': total_count,
+            'window_count': n,
+            'rate_per_s': round(n * 1e9 / span_ns, 2),
+            'mean_ms': round(total_ns / total_count / 1e6, 3) if total_count else 0.0,
+            'max_ms': round(max_ns / 1e6, 3),
+        }
+        targets = [(p, max(1, int(round(p / 100.0 * n)))) for p in percentiles]
+        seen, t = 0, 0
+        values = {}
+        for idx, c in enumerate(counts):
+            if not c:
+                continue
+            seen += c
+            while t < len(targets) and seen >= targets[t][1]:
+                values[targets[t][0]] = min(bucket_value(idx), max_ns)
+                t += 1
+            if t == len(targets):
+                break
+        for p in percentiles:
+            out[f'p{p}_ms'] = round(values.get(p, 0) / 1e6, 3) if n else 0.0
+        return out
+
+
+# --- Timers ---
+class _StageTimer:
+    __slots__ = ('hist', 'start')
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        now = time.perf_counter_ns()
+        self.hist.record(now - self.start, now)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageMetrics:
+    """Named stage histograms; thread-safe, shared by all threads of a scanner."""
+
+    def __init__(self, enabled=METRICS_ENABLED, window=METRICS_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._hists = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        hist = self._hists.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._hists.setdefault(name, RollingHistogram(self.window))
+        return hist
+
+    def stage(self, name):
+        """Context manager timing one run of stage `name` (no-op when disabled)."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self.histogram(name))
+
+    def record(self, name, elapsed_ns):
+        if self.enabled:
+            self.histogram(name).record(elapsed_ns)
+
+    def snapshot(self):
+        return {name: hist.snapshot() for name, hist in sorted(self._hists.items())}
+
+    def to_json(self):
+        return json.dumps({'timestamp': time.time(), 'stages': self.snapshot()}, indent=2)
+
+    def to_prometheus(self, prefix='scanner_stage'):
+        lines = [
+            f'# HELP {prefix}_seconds Stage latency; quantiles over the rolling window.',
+            f'# TYPE {prefix}_seconds summary',
+        ]
+        for name, hist in sorted(self._hists.items()):
+            s = hist.snapshot()
+            for p in (50, 95, 99):
+                lines.append(f'{prefix}_seconds{{stage="{name}",quantile="0.{p}"}} {s[f"p{p}_ms"] / 1000.0}')
+            lines.append(f'{prefix}_seconds_sum{{stage="{name}"}} {hist.total_ns / 1e9}')
+            lines.append(f'{prefix}_seconds_count{{stage="{name}"}} {hist.total_count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = StageMetrics()
+
+
+# --- Overlay ---
+def draw_overlay(frame, fps_stage='frame', stages=None, source=None, origin=(10, 20)):
+    """
+    Draws FPS (rate of `fps_stage`) and p50/p95 of each stage in the top-left
+    corner of `frame`. Does nothing unless metrics and METRICS_OVERLAY are on.
+    """
+    source = source or metrics
+    if not (source.enabled and METRICS_OVERLAY):
+        return frame
+    snap = source.snapshot()
+    lines = []
+    if fps_stage in snap:
+        lines.append(f"FPS {snap[fps_stage]['rate_per_s']:.1f}  frame p95 {snap[fps_stage]['p95_ms']:.1f} ms")
+    for name in stages or [n for n in snap if n != fps_stage]:
+        if name in snap:
+            lines.append(f"{name:<14} p50 {snap[name]['p50_ms']:6.1f}  p95 {snap[name]['p95_ms']:6.1f} ms")
+    x, y = origin
+    for line in lines:
+        cv2.putText(frame, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3)
+        cv2.putText(frame, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 255), 1)
+        y += 18
+    return frame
+
+
+# --- Export ---
+class MetricsExporter:
+    """Dumps a StageMetrics to a file every `interval` seconds and/or serves it over HTTP."""
+
+    def __init__(self, source=None, path=METRICS_FILE, port=METRICS_PORT, interval=METRICS_INTERVAL):
+        self.source = source or metrics
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def render(self, fmt):
+        return self.source.to_prometheus() if fmt == 'prometheus' else self.source.to_json()
+
+    def dump(self):
+        fmt = 'prometheus' if self.path.endswith(('.prom', '.txt')) else 'json'
+        atomic_write(self.path, self.render(fmt).encode('utf-8'))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except Exception as e:
+                print("Metrics dump failed:", e)
+
+    def start(self):
+        if self.path:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        if self.port:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path == '/metrics':
+                        body, ctype = exporter.render('prometheus'), 'text/plain; version=0.0.4'
+                    elif self.path == '/metrics.json':
+                        body, ctype = exporter.render('json'), 'application/json'
+                    else:
+                        self.send_error(404)
+                        return
+                    data = body.encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', ctype)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"Metrics on http://127.0.0.1:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self.dump()                 # final numbers
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def start_exporter():
+    """Starts the configured exporter; returns None when metrics are off or nothing is configured."""
+    if not metrics.enabled or not (METRICS_FILE or METRICS_PORT):
+        return None
+    return MetricsExporter().start()
+
+
+def report():
+    """Prints the final stage summary at scanner exit (only when enabled)."""
+    if metrics.enabled:
+        print("Stage metrics:", json.dumps(metrics.snapshot(), indent=2))
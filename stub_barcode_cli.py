@@ -0,0 +1,26 @@
+import os
+import sys
+
+# Stand-in for BarcodeReaderCLI.exe when testing matrix_decoder offline.
+# Accepts the same arguments and prints the same XML shape parse_barcode_xml reads:
+#   python stub_barcode_cli.py -type=code39 <image_path> -f xml
+# The reported text can be set with STUB_BARCODE_TEXT.
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("-") and a != "xml"]
+    image_path = args[0] if args else ""
+    if not os.path.exists(image_path):
+        print(f"File not found: {image_path}", file=sys.stderr)
+        sys.exit(1)
+
+    text = os.environ.get("STUB_BARCODE_TEXT", "STUB-0001")
+    print('<?xml version="1.0" encoding="utf-8"?>')
+    print("<Barcodes>")
+    print("  <Barcode>")
+    print(f"    <Text>{text}</Text>")
+    print('    <Rect Left="10" Top="20" Width="100" Height="40"/>')
+    print("  </Barcode>")
+    print("</Barcodes>")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# Tiled parallel decoding
+# -----------------------
+# High-resolution board scans are decoded whole today, so memory and latency
+# grow with megapixels and one core does all the work. With TILED_DECODE=1,
+# images of TILE_MIN_MEGAPIXELS or more are split into overlapping tiles that
+# are decoded in parallel:
+#
+#   - tile side: TILE_SIZE, or TILE_SYMBOLS_ACROSS x the smallest expected
+#     symbol (TILE_MIN_SYMBOL_PX), so small codes stay large relative to the tile
+#   - overlap:   TILE_OVERLAP, or TILE_MAX_SYMBOL_PX, so every symbol up to that
+#     size lies whole inside at least one tile
+#   - at most TILE_WORKERS tiles in flight, fewer if TILE_MEMORY_MB would be
+#     exceeded (tiles are views; a decoder's copy lives only while it runs)
+#
+# Quads are shifted back to image coordinates, and a code read in several
+# overlapping tiles (same text, intersecting boxes) is kept once, with its
+# largest box. image_barcode (Dynamsoft) and the pyzbar scripts use this module.
+#
+#   TILED_DECODE=1 TILE_MIN_SYMBOL_PX=60 python run_decode.py high_res_scans/
+
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from barcode_result import BarcodeResult
+
+TILED_DECODE = os.environ.get('TILED_DECODE', '0') == '1'
+TILE_MIN_MEGAPIXELS = float(os.environ.get('TILE_MIN_MEGAPIXELS', '8'))   # Smaller images are decoded whole
+TILE_SIZE = int(os.environ.get('TILE_SIZE', '0'))                 # Tile side in px, 0 = from TILE_MIN_SYMBOL_PX
+TILE_OVERLAP = int(os.environ.get('TILE_OVERLAP', '0'))           # Overlap in px, 0 = TILE_MAX_SYMBOL_PX
+TILE_MIN_SYMBOL_PX = int(os.environ.get('TILE_MIN_SYMBOL_PX', '80'))
+TILE_MAX_SYMBOL_PX = int(os.environ.get('TILE_MAX_SYMBOL_PX', '400'))
+TILE_SYMBOLS_ACROSS = 12    # Auto tile side, in smallest symbols
+TILE_WORKERS = int(os.environ.get('TILE_WORKERS', str(os.cpu_count() or 2)))
+TILE_MEMORY_MB = float(os.environ.get('TILE_MEMORY_MB', '256'))   # Cap on tile pixels resident at once
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def should_tile(img, enabled=None):
+    """True when tiling is on and `img` is large enough to be worth splitting."""
+    enabled = TILED_DECODE if enabled is None else enabled
+    return enabled and img.shape[0] * img.shape[1] >= TILE_MIN_MEGAPIXELS * 1e6
+
+
+def tile_geometry(tile_size=None, overlap=None):
+    """(tile side, overlap) in px from the explicit values or the symbol sizes."""
+    overlap = overlap or TILE_OVERLAP or TILE_MAX_SYMBOL_PX
+    tile_size = tile_size or TILE_SIZE or TILE_SYMBOLS_ACROSS * TILE_MIN_SYMBOL_PX
+    if tile_size <= overlap:
+        raise ValueError(f"Tile size {tile_size} px must exceed the overlap of {overlap} px")
+    return tile_size, overlap
+
+
+def _starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, step))
+    return starts + [length - tile]     # last tile flush with the edge
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """(x, y, w, h) of overlapping tiles covering a width x height image, row by row."""
+    step = tile_size - overlap
+    return [(x, y, min(tile_size, width), min(tile_size, height))
+            for y in _starts(height, tile_size, step)
+            for x in _starts(width, tile_size, step)]
+
+
+# --- Result handling ---
+def shift_record(record, dx, dy):
+    """BarcodeResult (or image_barcode-style record) as a BarcodeResult with its quad moved by (dx, dy)."""
+    r = BarcodeResult.from_record(record)
+    return BarcodeResult(r.text, r.format, r.confidence, [(x + dx, y + dy) for x, y in r.localization])
+
+
+def _box(points):
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def dedupe(items, text=lambda r: r['text'], points=lambda r: r['localization']):
+    """
+    Drops repeated reads of one code from overlapping tiles: items with the
+    same text whose boxes intersect collapse into the one with the largest box.
+    Equal texts far apart (two identical labels) are both kept.
+    """
+    kept = []       # (text, box, area, item)
+    for item in items:
+        box = _box(points(item))
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        for idx, (t, other, other_area, _) in enumerate(kept):
+            if t == text(item) and _intersects(box, other):
+                if area > other_area:
+                    kept[idx] = (t, box, area, item)
+                break
+        else:
+            kept.append((text(item), box, area, item))
+    return [entry[3] for entry in kept]
+
+
+# --- Decoding ---
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max(1, TILE_WORKERS), thread_name_prefix='tile')
+        return _pool
+
+
+def decode_tiles(img, decode, shift=shift_record, tile_size=None, overlap=None,
+                 workers=TILE_WORKERS, memory_mb=TILE_MEMORY_MB, **dedupe_keys):
+    """
+    Runs `decode(tile)` over the tiles of `img` on the shared tile pool and
+    returns the deduplicated results in image coordinates. `shift(item, dx, dy)`
+    moves one result; `dedupe_keys` (text=, points=) describe non-dict results.
+    """
+    tile_size, overlap = tile_geometry(tile_size, overlap)
+    h, w = img.shape[:2]
+    tiles = tile_grid(w, h, tile_size, overlap)
+    tile_bytes = tile_size * tile_size * (img.shape[2] if img.ndim == 3 else 1)
+    max_inflight = max(1, min(workers, int(memory_mb * 2 ** 20 // tile_bytes)))
+
+    pool = _get_pool()
+    found, in_flight = [], {}
+
+    def finish(done):
+        for fut in done:
+            x, y = in_flight.pop(fut)
+            found.extend(shift(item, x, y) for item in fut.result() or [])
+
+    for x, y, tw, th in tiles:
+        while len(in_flight) >= max_inflight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            finish(done)
+        in_flight[pool.submit(decode, img[y:y + th, x:x + tw])] = (x, y)
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        finish(done)
+    return dedupe(found, **dedupe_keys)
+
+
+# --- pyzbar ---
+def _shift_zbar(d, dx, dy):
+    return d._replace(rect=d.rect._replace(left=d.rect.left + dx, top=d.rect.top + dy),
+                      polygon=[p._replace(x=p.x + dx, y=p.y + dy) for p in d.polygon])
+
+
+def _zbar_points(d):
+    return [(p.x, p.y) for p in d.polygon] or \
+        [(d.rect.left, d.rect.top), (d.rect.left + d.rect.width, d.rect.top + d.rect.height)]
+
+
+def zbar_decode(frame, enabled=None, **tiling):
+    """
+    pyzbar.decode(frame), tiled when should_tile(frame): the same Decoded
+    tuples come back, with rect and polygon in frame coordinates.
+    """
+    from pyzbar import pyzbar
+    if not should_tile(frame, enabled):
+        return pyzbar.decode(frame)
+    return decode_tiles(frame, pyzbar.decode, _shift_zbar,
+                        text=lambda d: d.data, points=_zbar_points, **tiling)
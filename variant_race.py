@@ -0,0 +1,267 @@
+# Racing preprocessing variants
+# -----------------------------
+# Instead of writing inverted / thresholded / bg-removed copies of an image and
+# decoding each one in turn, VariantRacer decodes several preprocessing
+# variants of one in-memory image concurrently and stops at the first set of
+# results that meets the stop rule (expected count and/or symbologies, as in
+# DecoderCascade):
+#
+#   raw            the image as given
+#   inverted       gray, inverted (light codes on dark boards)
+#   otsu           gray, Otsu binarisation
+#   clahe          gray, contrast-limited histogram equalisation
+#   gray_threshold gray, board histogram level (as grayscale.py), max 200, inverted
+#
+# Variants are built lazily inside the worker that decodes them, and at most
+# `workers` are in flight: once the rule is met, queued variants are cancelled
+# and never built. (A decode that has already started cannot be interrupted;
+# its result is simply dropped.)
+#
+# Each race records which variant won, per product type. With learn=True the
+# next image of that product tries the variants in win order, so the usual
+# winner goes first and the mean number of decodes per image drops.
+#
+#   python variant_race.py sample_images --product pcb-a --expected-count 2 --stats race_stats.json
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+
+from board_segment import histogram_threshold
+from decoder_cascade import DecoderCascade, normalize_format, stop_reached
+from result_sinks import atomic_write
+
+DEFAULT_VARIANTS = ('raw', 'inverted', 'otsu', 'clahe', 'gray_threshold')
+RACE_WORKERS = int(os.environ.get('RACE_WORKERS', '2'))
+CLAHE_CLIP = 2.0
+CLAHE_TILES = (8, 8)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+# --- Variants ---
+class VariantSource:
+    """One input image plus its gray version, computed once on first use by any variant."""
+
+    def __init__(self, img):
+        self.img = img
+        self._gray = None
+        self._lock = threading.Lock()
+
+    @property
+    def gray(self):
+        with self._lock:
+            if self._gray is None:
+                img = self.img
+                if img.ndim == 2:
+                    self._gray = img
+                else:
+                    code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+                    self._gray = cv2.cvtColor(img, code)
+            return self._gray
+
+
+def _otsu(src):
+    return cv2.threshold(src.gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+
+def _clahe(src):
+    return cv2.createCLAHE(clipLimit=CLAHE_CLIP, tileGridSize=CLAHE_TILES).apply(src.gray)
+
+
+def _gray_threshold(src):
+    gray = src.gray
+    _, bw = cv2.threshold(gray, histogram_threshold(gray), 200, cv2.THRESH_BINARY)
+    return cv2.bitwise_not(bw)
+
+
+VARIANTS = {
+    'raw': lambda src: src.img,
+    'inverted': lambda src: cv2.bitwise_not(src.gray),
+    'otsu': _otsu,
+    'clahe': _clahe,
+    'gray_threshold': _gray_threshold,
+}
+
+
+# --- Race ---
+class VariantRacer:
+    """
+    Decodes variants of an image on a shared thread pool until `expected_count`
+    texts / `expected_formats` are found (with neither, the first hit wins).
+    `decoder` maps an image to image_barcode-style result dicts; by default a
+    DecoderCascade over pyzbar, pylibdmtx and Dynamsoft.
+    """
+
+    def __init__(self, decoder=None, variants=DEFAULT_VARIANTS, workers=RACE_WORKERS,
+                 expected_count=None, expected_formats=None, learn=True, stats_path=None):
+        unknown = [name for name in variants if name not in VARIANTS]
+        if unknown:
+            raise ValueError(f"Unknown variant(s): {unknown}")
+        self.decoder = decoder or DecoderCascade().decode
+        self.variants = tuple(variants)
+        self.workers = max(1, workers)
+        self.expected_count = expected_count
+        self.expected_formats = {normalize_format(f) for f in (expected_formats or ())}
+        self.learn = learn
+        self.stats_path = stats_path
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='variant')
+        self._lock = threading.Lock()
+        self.products = {}
+        if stats_path and os.path.exists(stats_path):
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                self.products = json.load(f)
+
+    def _product_stats(self, product):
+        stats = self.products.setdefault(product, {'images': 0, 'decodes': 0, 'unsolved': 0, 'wins': {}})
+        for name in self.variants:
+            stats['wins'].setdefault(name, 0)
+        return stats
+
+    def order_for(self, product='default'):
+        """Variants by past wins for `product` (most first); ties keep the configured order."""
+        with self._lock:
+            wins = self._product_stats(product)['wins']
+            if not self.learn:
+                return list(self.variants)
+            return sorted(self.variants, key=lambda name: -wins[name])
+
+    def _decode_variant(self, name, src):
+        start = time.perf_counter()
+        try:
+            found = self.decoder(VARIANTS[name](src)) or []
+        except Exception as e:
+            print(f"Variant '{name}' failed: {e}")
+            found = []
+        return found, (time.perf_counter() - start) * 1000.0
+
+    def decode(self, img, product='default'):
+        """
+        Races the variants on one image. Returns a report dict:
+          results   merged result dicts, each tagged with the 'variant' that found it
+          winner    variant whose results met the stop rule (None if never met)
+          decoded   variants that ran to completion, in finishing order
+          cancelled variants that were never built
+          abandoned variants still running when the race ended (results dropped)
+          ms        wall time of the race
+        """
+        start = time.perf_counter()
+        src = VariantSource(img)
+        queue = self.order_for(product)
+        merged, decoded, winner = {}, [], None
+        in_flight = {}
+
+        while queue or in_flight:
+            while queue and len(in_flight) < self.workers:
+                name = queue.pop(0)
+                in_flight[self.pool.submit(self._decode_variant, name, src)] = name
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = in_flight.pop(fut)
+                found, _ = fut.result()
+                decoded.append(name)
+                for r in found:
+                    merged.setdefault(r['text'], dict(r, variant=name))
+                if winner is None and stop_reached(list(merged.values()), self.expected_formats,
+                                                   self.expected_count):
+                    winner = name
+            if winner is not None:
+                for fut in in_flight:
+                    fut.cancel()
+                break
+
+        report = {
+            'results': list(merged.values()),
+            'winner': winner,
+            'decoded': decoded,
+            'cancelled': queue + [name for fut, name in in_flight.items() if fut.cancelled()],
+            'abandoned': [name for fut, name in in_flight.items() if not fut.cancelled()],
+            'ms': round((time.perf_counter() - start) * 1000.0, 1),
+        }
+        with self._lock:
+            stats = self._product_stats(product)
+            stats['images'] += 1
+            stats['decodes'] += len(decoded) + len(report['abandoned'])
+            if winner is None:
+                stats['unsolved'] += 1
+            else:
+                stats['wins'][winner] += 1
+        return report
+
+    def report(self):
+        """Per product: images, mean decodes per image, wins per variant and the learned order."""
+        out = {}
+        for product in list(self.products):
+            order = self.order_for(product)
+            with self._lock:
+                stats = self.products[product]
+                out[product] = {
+                    'images': stats['images'],
+                    'unsolved': stats['unsolved'],
+                    'decodes_per_image': round(stats['decodes'] / stats['images'], 2) if stats['images'] else 0.0,
+                    'wins': dict(stats['wins']),
+                    'order': order,
+                }
+        return out
+
+    def save(self):
+        """Writes the win counts to `stats_path` so the learned order survives restarts."""
+        if self.stats_path:
+            with self._lock:
+                data = json.dumps(self.products, indent=2)
+            atomic_write(self.stats_path, data.encode('utf-8'))
+
+    def close(self):
+        self.save()
+        self.pool.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decode images by racing preprocessing variants.')
+    parser.add_argument('sources', nargs='+', help='Image files or directories')
+    parser.add_argument('--product', default='default', help='Product type the win statistics are kept for')
+    parser.add_argument('--expected-count', type=int, help='Stop once this many distinct codes are found')
+    parser.add_argument('--formats', nargs='*', default=(), help='Stop once these symbologies are found')
+    parser.add_argument('--variants', nargs='*', default=DEFAULT_VARIANTS, choices=sorted(VARIANTS))
+    parser.add_argument('--workers', type=int, default=RACE_WORKERS)
+    parser.add_argument('--decoders', nargs='*', default=('zbar', 'dmtx', 'dynamsoft'),
+                        help='DecoderCascade backends used on every variant')
+    parser.add_argument('--stats', help='JSON file the per-product win counts are loaded from / saved to')
+    parser.add_argument('--no-learn', action='store_true', help='Always use the --variants order')
+    args = parser.parse_args()
+
+    paths = []
+    for src in args.sources:
+        if os.path.isdir(src):
+            paths.extend(os.path.join(src, n) for n in sorted(os.listdir(src))
+                         if n.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(src)
+    if not paths:
+        print("No images found.")
+        sys.exit(1)
+
+    racer = VariantRacer(DecoderCascade(args.decoders).decode, args.variants, args.workers,
+                         args.expected_count, args.formats, not args.no_learn, args.stats)
+    try:
+        for path in paths:
+            img = cv2.imread(path)
+            if img is None:
+                print(f"ERROR: Could not read {path}")
+                continue
+            race = racer.decode(img, args.product)
+            texts = [f"{r['text']} ({r['variant']})" for r in race['results']]
+            print(f"{path}: winner={race['winner']} decoded={race['decoded']} "
+                  f"cancelled={race['cancelled']} {race['ms']} ms -> {texts}")
+    finally:
+        racer.close()
+    print("Variant stats:", json.dumps(racer.report(), indent=2))
+
+
+if __name__ == '__main__':
+    main()